@@ -118,7 +118,7 @@ resource "google_cloud_run_v2_service" "serve" {
       }
       env {
         name  = "MODEL_PATH"
-        value = "gs://${google_storage_bucket.models.name}/models/latest/model.pt"
+        value = "gs://${google_storage_bucket.models.name}/models/latest/model.safetensors"
       }
     }
   }
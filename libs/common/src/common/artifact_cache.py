@@ -0,0 +1,230 @@
+"""Content-addressed on-disk cache for remote model artifacts (serve side).
+
+A `gs://` (or `file://`) URI naming one object or a prefix resolves to a key derived
+from its contents' CRC32Cs and sizes, so a rewritten object gets a new entry and the
+same bytes reached through two URIs (`<run_id>/` and `latest/`) share one:
+
+    <root>/objects/<key>/...   complete entries: the file, or the prefix's tree
+    <root>/refs/<hash>.json    last key each URI resolved to
+    <root>/locks/<key>.lock    exclusive while fetched or evicted, shared while read
+    <root>/tmp/                downloads in progress
+
+Entries are downloaded into tmp/ and renamed into objects/, so readers never see a
+partial one, and a file lock per key makes concurrent loaders (workers of one
+container, or containers sharing a volume) wait for a single download instead of
+racing. Reads touch the entry; beyond `max_mb` the least recently used entries are
+evicted, skipping any that a reader holds through `use` (or `artifact_path`).
+Resolving costs one metadata request; with `revalidate` off, a URI seen before is
+served from its ref with no network I/O at all.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from common.transfer import ObjectInfo, ObjectStore, TransferConfig, is_remote, open_store
+
+
+class ArtifactCacheConfig(BaseModel):
+    root: Path = Path("/tmp/artifact-cache")
+    max_mb: float = 10240.0  # Evict least recently used entries beyond this
+    revalidate: bool = True  # Check a known URI's current contents before reusing its entry
+
+    @classmethod
+    def from_env(cls) -> "ArtifactCacheConfig":
+        return cls(
+            root=Path(os.environ.get("ARTIFACT_CACHE_DIR", "/tmp/artifact-cache")),
+            max_mb=float(os.environ.get("ARTIFACT_CACHE_MAX_MB", 10240)),
+            revalidate=os.environ.get("ARTIFACT_CACHE_REVALIDATE", "1").lower()
+            in ("1", "true", "yes"),
+        )
+
+
+class _Ref(BaseModel):
+    uri: str
+    key: str
+    path: str  # Entry-relative path returned for the URI ("" for a prefix)
+
+
+# Fetches retried when another process evicts the entry between download and lock
+_ATTEMPTS = 3
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+class ArtifactCache:
+    def __init__(self, config: ArtifactCacheConfig, transfer: TransferConfig | None = None) -> None:
+        self.config = config
+        self.transfer = transfer
+        self.objects = config.root / "objects"
+        self.refs = config.root / "refs"
+        self.locks = config.root / "locks"
+        self.tmp = config.root / "tmp"
+        for d in (self.objects, self.refs, self.locks, self.tmp):
+            d.mkdir(parents=True, exist_ok=True)
+
+    def fetch(self, uri: str) -> Path:
+        """Local path of `uri`'s contents: the file for an object, a directory for a prefix.
+
+        Nothing keeps the entry from being evicted once this returns; read it inside `use`.
+        """
+        with self.use(uri) as path:
+            return path
+
+    @contextmanager
+    def use(self, uri: str) -> Generator[Path]:
+        """`fetch`, with the entry protected from eviction until the block exits."""
+        ref_path = self.refs / f"{_digest(uri)}.json"
+        ref: _Ref | None = None
+        if not self.config.revalidate and ref_path.is_file():
+            ref = _Ref.model_validate_json(ref_path.read_text())
+        for _ in range(_ATTEMPTS):
+            if ref is not None:
+                with self._lock(ref.key, shared=True):
+                    entry = self.objects / ref.key
+                    if self._touch(entry):
+                        tmp_ref = (
+                            self.tmp / f"{ref_path.name}.{os.getpid()}.{threading.get_ident()}"
+                        )
+                        tmp_ref.write_text(ref.model_dump_json())
+                        os.replace(tmp_ref, ref_path)
+                        yield entry / ref.path if ref.path else entry
+                        return
+            # Unknown URI, or its entry was evicted before we could hold it
+            ref = self._materialize(uri)
+        raise RuntimeError(f"{uri} was evicted {_ATTEMPTS} times while fetching; raise max_mb")
+
+    def _materialize(self, uri: str) -> _Ref:
+        """Resolve `uri` to its key, downloading the entry if the cache lacks it."""
+        store, name = open_store(uri, self.transfer)
+        single = store.stat(name)
+        if single is not None:
+            objects = {name: single}
+            base = name.rsplit("/", 1)[0] + "/" if "/" in name else ""
+            rel = name[len(base) :]
+        else:
+            base = name.rstrip("/") + "/" if name else ""
+            objects = {n: i for n, i in store.list(base).items() if n != base}
+            rel = ""
+            if not objects:
+                raise FileNotFoundError(f"No objects under {uri}")
+        manifest = sorted((n[len(base) :], i.crc32c, i.size) for n, i in objects.items())
+        ref = _Ref(uri=uri, key=_digest(json.dumps(manifest)), path=rel)
+
+        if not (self.objects / ref.key).is_dir():
+            with self._lock(ref.key):
+                if not (self.objects / ref.key).is_dir():  # Another loader may have won
+                    self._download(store, base, objects, ref.key)
+            self._evict(keep=ref.key)
+        return ref
+
+    @staticmethod
+    def _touch(entry: Path) -> bool:
+        """Mark `entry` recently used (for LRU eviction); False if it no longer exists."""
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @contextmanager
+    def _lock(self, key: str, blocking: bool = True, shared: bool = False) -> Generator[bool]:
+        """Readers hold the key's lock shared; downloads and eviction hold it exclusively."""
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        with (self.locks / f"{key}.lock").open("a") as f:
+            try:
+                fcntl.flock(f, mode | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _download(
+        self, store: ObjectStore, base: str, objects: dict[str, ObjectInfo], key: str
+    ) -> None:
+        staging = Path(tempfile.mkdtemp(dir=self.tmp, prefix=f"{key}-"))
+        threads = (self.transfer or TransferConfig.from_env()).threads
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                jobs = [
+                    pool.submit(store.download, name, staging / name[len(base) :])
+                    for name in objects
+                ]
+                for job in jobs:
+                    job.result()
+            os.rename(staging, self.objects / key)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _evict(self, keep: str) -> None:
+        """Delete least recently used entries until the cache fits `max_mb`."""
+        entries: list[tuple[float, int, Path]] = []
+        for entry in self.objects.iterdir():
+            try:
+                size = sum(p.stat().st_size for p in entry.rglob("*") if p.is_file())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                continue  # Evicted by another process meanwhile
+        total = sum(size for _, size, _ in entries)
+        budget = self.config.max_mb * 2**20
+        for _, size, entry in sorted(entries):
+            if total <= budget:
+                break
+            if entry.name == keep:
+                continue
+            with self._lock(entry.name, blocking=False) as locked:
+                if not locked or not entry.is_dir():  # In use (or being re-fetched), or gone
+                    continue
+                # Rename first so no reader picks up a half-deleted entry; open files
+                # (and mmaps) of processes already using it stay valid.
+                doomed = self.tmp / f"evict-{entry.name}-{os.getpid()}"
+                os.rename(entry, doomed)
+                shutil.rmtree(doomed, ignore_errors=True)
+                total -= size
+
+
+_cache: ArtifactCache | None = None
+_cache_lock = threading.Lock()
+
+
+def _default_cache() -> ArtifactCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ArtifactCache(ArtifactCacheConfig.from_env())
+        return _cache
+
+
+def fetch_artifact(uri: str) -> Path:
+    """Fetch through the process-wide cache configured from the environment."""
+    return _default_cache().fetch(uri)
+
+
+@contextmanager
+def artifact_path(path: str) -> Generator[Path]:
+    """Local path to read `path` from within the block.
+
+    A remote URI is fetched through the process-wide cache and its entry cannot be evicted
+    until the block exits. Files opened or mapped inside the block stay readable after it.
+    A local path is passed through.
+    """
+    if not is_remote(path):
+        yield Path(path)
+        return
+    with _default_cache().use(path) as local:
+        yield local
@@ -0,0 +1,118 @@
+"""Measure DDP gradient all-reduce time per step for each communication setting.
+
+Run under torchrun; gloo on CPU by default, so one box can stand in for the cluster:
+
+    torchrun --nproc_per_node 4 -m common.bench_ddp [--steps 20] [--hidden 1024] [--layers 8]
+
+Each setting wraps a fresh MLP with wrap_ddp and times `steps` training steps twice:
+once normally and once under no_sync (no gradient communication). The difference is
+the communication time per step that the setting leaves exposed after overlap with
+backward.
+"""
+
+import argparse
+import time
+from typing import Any
+
+import torch
+import torch.nn as nn
+from pydantic import BaseModel
+
+from common.config import DistributedConfig
+from common.distributed import (
+    all_reduce_sum,
+    cleanup_distributed,
+    get_distributed_config,
+    grad_sync,
+    setup_distributed,
+    wrap_ddp,
+)
+
+SETTINGS: dict[str, dict[str, Any]] = {
+    "default": {},
+    "bucket 1MB": {"bucket_cap_mb": 1.0},
+    "bucket 100MB": {"bucket_cap_mb": 100.0},
+    "bucket view": {"gradient_as_bucket_view": True},
+    "static graph": {"static_graph": True},
+    "fp16 hook": {"comm_hook": "fp16"},
+    "bf16 hook": {"comm_hook": "bf16"},
+    "powersgd r1": {"comm_hook": "powersgd", "powersgd_rank": 1},
+    "powersgd r4": {"comm_hook": "powersgd", "powersgd_rank": 4},
+}
+WARMUP = 12  # > PowerSGD's uncompressed start steps
+
+
+class BenchResult(BaseModel):
+    setting: str
+    step_ms: float
+    no_sync_ms: float
+    comm_ms: float
+
+
+def _mlp(hidden: int, layers: int) -> nn.Module:
+    torch.manual_seed(0)
+    blocks: list[nn.Module] = []
+    for _ in range(layers):
+        blocks += [nn.Linear(hidden, hidden), nn.ReLU()]
+    return nn.Sequential(*blocks)
+
+
+def bench(
+    name: str,
+    config: DistributedConfig,
+    hidden: int,
+    layers: int,
+    batch_size: int,
+    steps: int,
+) -> BenchResult:
+    device = torch.device("cpu")
+    model = wrap_ddp(_mlp(hidden, layers), config, device)
+    optimizer = torch.optim.SGD(model.parameters(), lr=1e-3)
+    x = torch.randn(batch_size, hidden)
+
+    def run(n: int, sync: bool) -> float:
+        start = time.perf_counter()
+        for _ in range(n):
+            optimizer.zero_grad()
+            with grad_sync(model, sync):
+                model(x).square().mean().backward()
+            optimizer.step()
+        # Mean over ranks.
+        elapsed = torch.tensor([time.perf_counter() - start])
+        return float(all_reduce_sum(elapsed).item()) / config.world_size / n * 1000
+
+    run(WARMUP, sync=True)
+    step_ms = run(steps, sync=True)
+    no_sync_ms = run(steps, sync=False)
+    return BenchResult(
+        setting=name,
+        step_ms=step_ms,
+        no_sync_ms=no_sync_ms,
+        comm_ms=max(0.0, step_ms - no_sync_ms),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark DDP communication settings")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--hidden", type=int, default=1024)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    cfg = get_distributed_config()
+    setup_distributed(cfg)
+    params = sum(p.numel() for p in _mlp(args.hidden, args.layers).parameters())
+    if cfg.rank == 0:
+        print(f"{cfg.world_size} ranks ({cfg.backend}), {params / 1e6:.1f}M parameters")
+        print(f"{'setting':>14} {'step ms':>9} {'no_sync ms':>11} {'comm ms':>9}")
+    for name, update in SETTINGS.items():
+        config = cfg.model_copy(update=update)
+        r = bench(name, config, args.hidden, args.layers, args.batch_size, args.steps)
+        if cfg.rank == 0:
+            print(f"{r.setting:>14} {r.step_ms:>9.1f} {r.no_sync_ms:>11.1f} {r.comm_ms:>9.1f}")
+    cleanup_distributed()
+
+
+if __name__ == "__main__":
+    main()
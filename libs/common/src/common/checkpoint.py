@@ -0,0 +1,248 @@
+"""Resumable training checkpoints: one shard per rank, written in the background.
+
+Layout under `directory` (a trainer's `checkpoint_dir / "resume" / <project>`, so the
+mnist and lora trainers sharing one `checkpoint_dir` never pick up each other's state):
+
+    step-<global step>/rank-<rank>.pt
+
+Each rank writes its own shard with the training state it needs to resume: the
+trainable parameters (the frozen LoRA base model is reloaded from its source), the
+optimizer and GradScaler state, its RNG states and its position in the epoch. Shards
+do not depend on each other, so checkpoint directories can be node-local. A shard is
+written to a temp file and renamed, so a shard that exists is complete.
+
+`save` first copies the state to CPU memory (the only part the training step waits
+for), then serializes it on a background thread. At most one write is in flight: the
+next save waits for the previous one. An epoch-end save at the same global step as a
+periodic one replaces it, so a resume never starts inside an exhausted epoch. A run that
+completes calls `finish`, which deletes the shards: the next run starts fresh instead of
+"resuming" a finished one.
+"""
+
+import os
+import random
+import re
+import threading
+from pathlib import Path
+from typing import cast
+
+import torch
+import torch.distributed as dist
+from pydantic import BaseModel
+
+from common.config import CheckpointConfig
+
+_STEP_DIR = re.compile(r"^step-(\d+)$")
+
+
+class TrainingPosition(BaseModel):
+    """Where training stands: resume trains `epoch` from batch `batch` on."""
+
+    epoch: int = 0
+    batch: int = 0  # Micro-batches of `epoch` already trained
+    global_step: int = 0  # Optimizer steps since the start of the run
+
+
+def trainable_state_dict(model: torch.nn.Module) -> dict[str, torch.Tensor]:
+    """State of the parameters that train; frozen weights are not checkpointed."""
+    return {name: p for name, p in model.named_parameters() if p.requires_grad}
+
+
+def _to_cpu(obj: object) -> object:
+    """Deep copy of a state dict with every tensor copied to CPU memory."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _to_cpu(v) for k, v in cast(dict[object, object], obj).items()}
+    if isinstance(obj, list | tuple):
+        return type(obj)(_to_cpu(v) for v in cast(list[object], obj))
+    return obj
+
+
+def _rng_state() -> dict[str, object]:
+    state: dict[str, object] = {"python": random.getstate(), "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def _set_rng_state(state: dict[str, object]) -> None:
+    random.setstate(cast(tuple[object, ...], state["python"]))
+    torch.set_rng_state(cast(torch.Tensor, state["torch"]))
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(cast(list[torch.Tensor], state["cuda"]))
+
+
+class Checkpointer:
+    """Checkpoints `model`, `optimizer` and `scaler` for this rank under `directory`.
+
+    The training loop calls `restore` once, then `begin_epoch`, `step` after every
+    optimizer step and `end_epoch`; `finish` ends a completed run (`close` only waits
+    for the last write, keeping the shards).
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        config: CheckpointConfig,
+        model: torch.nn.Module,
+        optimizer: torch.optim.Optimizer,
+        scaler: torch.amp.GradScaler,
+        rank: int = 0,
+    ) -> None:
+        self.directory = directory
+        self.config = config
+        self.model = model
+        self.optimizer = optimizer
+        self.scaler = scaler
+        self.rank = rank
+        self.position = TrainingPosition()
+        self._epoch_offset = 0
+        self._writer: threading.Thread | None = None
+        self._error: BaseException | None = None
+
+    def _shard(self, step: int) -> Path:
+        return self.directory / f"step-{step:08d}" / f"rank-{self.rank}.pt"
+
+    def local_steps(self) -> list[int]:
+        """Global steps for which this rank has a complete shard, oldest first."""
+        if not self.directory.is_dir():
+            return []
+        steps: list[int] = []
+        for path in self.directory.iterdir():
+            match = _STEP_DIR.match(path.name)
+            if match and self._shard(int(match.group(1))).is_file():
+                steps.append(int(match.group(1)))
+        return sorted(steps)
+
+    def latest_common_step(self) -> int | None:
+        """Newest step every rank has a shard for. A collective when distributed."""
+        steps = set(self.local_steps())
+        if dist.is_available() and dist.is_initialized():
+            gathered: list[object] = [None] * dist.get_world_size()
+            dist.all_gather_object(gathered, steps)
+            for other in gathered:
+                steps &= cast(set[int], other)
+        return max(steps) if steps else None
+
+    def restore(self) -> TrainingPosition:
+        """Load the newest common checkpoint, if any and resume is on (every rank must call).
+
+        Returns where to continue; a fresh TrainingPosition when nothing was restored.
+        """
+        if not self.config.resume:
+            return self.position
+        step = self.latest_common_step()
+        if step is None:
+            return self.position
+        state = torch.load(self._shard(step), map_location="cpu", weights_only=True)
+        result = self.model.load_state_dict(state["model"], strict=False)
+        if result.unexpected_keys:
+            raise ValueError(
+                f"Checkpoint {step} does not match the model: {result.unexpected_keys}"
+            )
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.scaler.load_state_dict(state["scaler"])
+        _set_rng_state(state["rng"])
+        self.position = TrainingPosition.model_validate(state["position"])
+        if self.rank == 0:
+            print(
+                f"Resumed from step {self.position.global_step}"
+                f" (epoch {self.position.epoch + 1}, batch {self.position.batch})"
+            )
+        return self.position
+
+    def begin_epoch(self, epoch: int) -> int:
+        """Start `epoch`; returns how many of its batches were trained before a resume."""
+        offset = self.position.batch if epoch == self.position.epoch else 0
+        self._epoch_offset = offset
+        self.position = TrainingPosition(
+            epoch=epoch, batch=offset, global_step=self.position.global_step
+        )
+        return offset
+
+    def step(self, batches: int) -> None:
+        """Record an optimizer step, `batches` micro-batches into this epoch's loader."""
+        self.position.batch = self._epoch_offset + batches
+        self.position.global_step += 1
+        every = self.config.every_steps
+        if every and self.position.global_step % every == 0:
+            self.save()
+
+    def end_epoch(self) -> None:
+        self.position = TrainingPosition(
+            epoch=self.position.epoch + 1, global_step=self.position.global_step
+        )
+        self.save()
+
+    def close(self) -> None:
+        self.wait()
+
+    def finish(self) -> None:
+        """Training completed: delete this rank's shards (every rank must call)."""
+        self.wait()
+        if dist.is_available() and dist.is_initialized():
+            dist.barrier()  # No rank may still need a shard to fall back on
+        for step in self.local_steps():
+            shard = self._shard(step)
+            shard.unlink(missing_ok=True)
+            try:
+                shard.parent.rmdir()  # Only once every rank's shard is gone
+            except OSError:
+                pass
+        try:
+            self.directory.rmdir()
+        except OSError:
+            pass
+
+    def save(self) -> None:
+        """Snapshot to CPU now; write the shard and rotate old ones in the background."""
+        self.wait()
+        snapshot = _to_cpu(
+            {
+                "model": trainable_state_dict(self.model),
+                "optimizer": self.optimizer.state_dict(),
+                "scaler": self.scaler.state_dict(),
+                "rng": _rng_state(),
+                "position": self.position.model_dump(),
+            }
+        )
+        self._writer = threading.Thread(
+            target=self._write,
+            args=(snapshot, self.position.global_step),
+            name="checkpoint-writer",
+            daemon=True,
+        )
+        self._writer.start()
+
+    def _write(self, snapshot: object, step: int) -> None:
+        try:
+            path = self._shard(step)
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f".{path.parent.name}-{path.name}.tmp"
+            torch.save(snapshot, tmp)
+            path.parent.mkdir(exist_ok=True)
+            os.replace(tmp, path)
+            self._rotate()
+        except BaseException as e:
+            self._error = e
+
+    def _rotate(self) -> None:
+        """Delete this rank's shards beyond the newest `keep`, and emptied step dirs."""
+        steps = self.local_steps()
+        for step in steps[: max(0, len(steps) - self.config.keep)]:
+            shard = self._shard(step)
+            shard.unlink(missing_ok=True)
+            try:
+                shard.parent.rmdir()  # Only once every rank's shard is gone
+            except OSError:
+                pass
+
+    def wait(self) -> None:
+        """Block until the pending write finishes; re-raise its error, if any."""
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
@@ -1,8 +1,14 @@
 import os
 from pathlib import Path
+from typing import Literal
 
 from pydantic import BaseModel
 
+# fp32: no autocast. bf16: bfloat16 autocast (CPU and GPU). fp16: float16 autocast with a
+# GradScaler. Trainable weights and optimizer state stay float32 in every mode.
+Precision = Literal["fp32", "bf16", "fp16"]
+CommHook = Literal["none", "fp16", "bf16", "powersgd"]
+
 
 class VertexConfig(BaseModel):
     project_id: str
@@ -28,10 +34,50 @@ class TrainingConfig(BaseModel):
     checkpoint_dir: Path = Path("./checkpoints")
 
 
+class DataLoaderConfig(BaseModel):
+    """Input pipeline knobs; None means derive from the host (see the resolved_* methods)."""
+
+    num_workers: int | None = None  # DataLoader worker processes per rank
+    pin_memory: bool | None = None  # Page-locked batches for async host-to-GPU copies
+    prefetch_factor: int = 2  # Batches each worker loads ahead
+    prefetch_depth: int = 2  # Batches DevicePrefetcher moves to the device ahead
+
+    def resolved_num_workers(self, local_world_size: int = 1) -> int:
+        """Split the cores between local ranks, keeping one per rank for the training loop."""
+        if self.num_workers is not None:
+            return self.num_workers
+        return max(0, min(4, (os.cpu_count() or 1) // max(1, local_world_size) - 1))
+
+    def resolved_pin_memory(self) -> bool:
+        if self.pin_memory is not None:
+            return self.pin_memory
+        import torch
+
+        return torch.cuda.is_available()
+
+
+class CheckpointConfig(BaseModel):
+    """Periodic resumable checkpoints (see common.checkpoint)."""
+
+    every_steps: int = 0  # Optimizer steps between checkpoints; 0 saves at epoch ends only
+    keep: int = 2  # Newest checkpoints kept per rank; older ones are deleted
+    resume: bool = True  # Resume from the newest checkpoint every rank has
+
+
 class DistributedConfig(BaseModel):
     rank: int
     world_size: int
     local_rank: int = 0
+    local_world_size: int = 1
     backend: str = "gloo"
     master_addr: str = "localhost"
     master_port: int = 29500
+    # DDP gradient communication (see common.distributed.wrap_ddp).
+    bucket_cap_mb: float = 25.0  # Gradients are all-reduced in buckets of about this size
+    gradient_as_bucket_view: bool = False  # Gradients alias the buckets: no copy, less memory
+    static_graph: bool = False  # Same used parameters every step: lets DDP cache bucket order
+    find_unused_parameters: bool = False  # Needed only if some trainable params go unused
+    # Gradient compression: fp16/bf16 halve all-reduce bytes; powersgd sends a low-rank
+    # approximation (rank powersgd_rank) with error feedback.
+    comm_hook: CommHook = "none"
+    powersgd_rank: int = 1
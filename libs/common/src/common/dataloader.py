@@ -1,9 +1,135 @@
 """Shared DataLoader creation with DistributedSampler — used by mnist and lora."""
 
-from collections.abc import Callable
-from typing import Any
+import itertools
+import math
+import queue
+import threading
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from typing import Any, Generic, NamedTuple, TypeVar, cast
 
-from torch.utils.data import DataLoader, Dataset
+import torch
+from pydantic import BaseModel
+from torch.utils.data import DataLoader, Dataset, DistributedSampler, Sampler
+
+T = TypeVar("T")
+
+
+class DistributedBucketBatchSampler(Sampler[list[int]]):
+    """Length-bucketed batches, sharded across ranks with DistributedSampler semantics.
+
+    Each epoch the indices are shuffled, cut into chunks of `bucket_batches` batches,
+    and each chunk is sorted by length before being split into batches, so a batch
+    only pads to its own longest example. Every rank sees the same number of batches
+    (the list is padded by repeating batches, or truncated with `drop_last`), and the
+    ranks of one step draw neighbouring batches of similar length. Call `set_epoch`
+    before each epoch, as with DistributedSampler; `set_offset` then skips the batches a
+    resumed run already trained on.
+    """
+
+    def __init__(
+        self,
+        lengths: Sequence[int],
+        batch_size: int,
+        rank: int,
+        world_size: int,
+        *,
+        shuffle: bool = True,
+        seed: int = 0,
+        bucket_batches: int = 50,
+        drop_last: bool = False,
+    ) -> None:
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.rank = rank
+        self.world_size = world_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.bucket_batches = bucket_batches
+        self.drop_last = drop_last
+        self.epoch = 0
+        self.offset = 0
+        chunk = batch_size * bucket_batches
+        n = len(lengths)
+        num_batches = sum(
+            math.ceil(min(chunk, n - start) / batch_size) for start in range(0, n, chunk)
+        )
+        if drop_last:
+            self.num_batches = num_batches // world_size
+        else:
+            self.num_batches = math.ceil(num_batches / world_size)
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+        self.offset = 0
+
+    def set_offset(self, batches: int) -> None:
+        self.offset = batches
+
+    def __len__(self) -> int:
+        return self.num_batches - self.offset
+
+    def __iter__(self) -> Iterator[list[int]]:
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        n = len(self.lengths)
+        order = torch.randperm(n, generator=g).tolist() if self.shuffle else list(range(n))
+        chunk = self.batch_size * self.bucket_batches
+        batches: list[list[int]] = []
+        for start in range(0, n, chunk):
+            bucket = sorted(order[start : start + chunk], key=self.lengths.__getitem__)
+            batches.extend(
+                bucket[i : i + self.batch_size] for i in range(0, len(bucket), self.batch_size)
+            )
+        total = self.num_batches * self.world_size
+        if batches and total > len(batches):
+            batches = (batches * math.ceil(total / len(batches)))[:total]
+        batches = batches[:total]
+        steps = [batches[i : i + self.world_size] for i in range(0, total, self.world_size)]
+        if self.shuffle:
+            steps = [steps[i] for i in torch.randperm(len(steps), generator=g).tolist()]
+        for step in steps[self.offset :]:
+            yield step[self.rank]
+
+
+class ResumableDistributedSampler(DistributedSampler[Any]):
+    """DistributedSampler that can start an epoch `offset` samples in, for mid-epoch resume.
+
+    The epoch's order is unchanged (it depends only on seed and epoch), so the skipped
+    samples are exactly the ones the interrupted run already trained on.
+    """
+
+    offset = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        super().set_epoch(epoch)
+        self.offset = 0
+
+    def set_offset(self, samples: int) -> None:
+        self.offset = samples
+
+    def __len__(self) -> int:
+        return max(0, self.num_samples - self.offset)
+
+    def __iter__(self) -> Iterator[Any]:
+        return itertools.islice(super().__iter__(), self.offset, None)
+
+
+class ShardedSampler(Sampler[int]):
+    """Every `world_size`-th index from `rank`, in order, for evaluation.
+
+    Unlike DistributedSampler nothing is padded or repeated: each example is seen by
+    exactly one rank, and shard sizes differ by at most one. Ranks therefore run
+    different numbers of batches, so sum metrics and all-reduce them once at the end.
+    """
+
+    def __init__(self, num_samples: int, rank: int, world_size: int) -> None:
+        self.indices = range(rank, num_samples, world_size)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.indices)
 
 
 def create_distributed_dataloader(
@@ -14,16 +140,189 @@ def create_distributed_dataloader(
     *,
     collate_fn: Callable[..., Any] | None = None,
     num_workers: int = 1,
+    lengths: Sequence[int] | None = None,
+    pin_memory: bool = False,
+    prefetch_factor: int = 2,
 ) -> DataLoader[Any]:
-    """DistributedSampler + DataLoader creation — shared by mnist and lora."""
-    from torch.utils.data import DistributedSampler
+    """DistributedSampler + DataLoader creation — shared by mnist and lora.
 
-    sampler = DistributedSampler(dataset, num_replicas=world_size, rank=rank)
+    With `lengths` (one per example), batches come from DistributedBucketBatchSampler
+    so `collate_fn` can pad to the longest example in each batch. The loader draws its
+    worker seeds from its own generator rather than the global RNG, so starting an
+    epoch does not shift dropout randomness (a resumed run replays it exactly).
+    """
+    generator = torch.Generator()
+    generator.manual_seed(rank)
+    if lengths is not None:
+        batch_sampler = DistributedBucketBatchSampler(lengths, batch_size, rank, world_size)
+        return DataLoader(
+            dataset,
+            batch_sampler=batch_sampler,
+            collate_fn=collate_fn,
+            num_workers=num_workers,
+            generator=generator,
+            persistent_workers=num_workers > 0,
+            pin_memory=pin_memory,
+            prefetch_factor=prefetch_factor if num_workers > 0 else None,
+        )
+    sampler = ResumableDistributedSampler(dataset, num_replicas=world_size, rank=rank)
     return DataLoader(
         dataset,
         batch_size=batch_size,
         sampler=sampler,
         collate_fn=collate_fn,
         num_workers=num_workers,
+        generator=generator,
         persistent_workers=num_workers > 0,
+        pin_memory=pin_memory,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
     )
+
+
+def create_sharded_dataloader(
+    dataset: Dataset[Any],
+    batch_size: int,
+    rank: int,
+    world_size: int,
+    *,
+    collate_fn: Callable[..., Any] | None = None,
+    num_workers: int = 0,
+    pin_memory: bool = False,
+) -> DataLoader[Any]:
+    """Evaluation DataLoader over this rank's ShardedSampler shard of `dataset`."""
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        sampler=ShardedSampler(len(cast(Sequence[Any], dataset)), rank, world_size),
+        collate_fn=collate_fn,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+    )
+
+
+def set_epoch(dataloader: DataLoader[Any], epoch: int, offset: int = 0) -> None:
+    """Reshuffle a loader built by create_distributed_dataloader for `epoch`.
+
+    `offset` skips the first batches of the epoch (already trained before a resume).
+    """
+    for sampler in (dataloader.sampler, dataloader.batch_sampler):
+        if isinstance(sampler, DistributedSampler | DistributedBucketBatchSampler):
+            sampler.set_epoch(epoch)
+        if isinstance(sampler, DistributedBucketBatchSampler):
+            sampler.set_offset(offset)
+        elif isinstance(sampler, ResumableDistributedSampler):
+            sampler.set_offset(offset * (dataloader.batch_size or 1))
+
+
+def move_to_device(batch: T, device: torch.device, non_blocking: bool = False) -> T:
+    """Copy every tensor in a batch (tensor, tuple/list, or pydantic model) to `device`."""
+    if isinstance(batch, torch.Tensor):
+        return cast(T, batch.to(device, non_blocking=non_blocking))
+    if isinstance(batch, tuple | list):
+        items = cast(Iterable[object], batch)
+        return cast(T, type(batch)(move_to_device(b, device, non_blocking) for b in items))
+    if isinstance(batch, BaseModel):
+        fields = {k: move_to_device(v, device, non_blocking) for k, v in batch}
+        return cast(T, batch.model_construct(**fields))
+    return batch
+
+
+def _record_stream(batch: object, stream: torch.cuda.Stream) -> None:
+    """Tell the caching allocator the consumer stream uses tensors made on the side stream."""
+    if isinstance(batch, torch.Tensor):
+        batch.record_stream(stream)
+    elif isinstance(batch, tuple | list):
+        for item in cast(Iterable[object], batch):
+            _record_stream(item, stream)
+    elif isinstance(batch, BaseModel):
+        for _, value in batch:
+            _record_stream(value, stream)
+
+
+class _Ready(NamedTuple):
+    batch: object
+    event: torch.cuda.Event | None
+
+
+class _Failed(NamedTuple):
+    error: BaseException
+
+
+class DevicePrefetcher(Generic[T]):
+    """Iterate a DataLoader with batches already on `device`, `depth` batches ahead.
+
+    A background thread pulls batches from the loader and copies them to the device, so
+    loading, collation and the host-to-device copy of batch N+1 overlap compute on batch
+    N. On CUDA the copies run non-blocking on a side stream; an event makes the training
+    stream wait only for its own batch. On CPU the thread overlaps loading and collation.
+    """
+
+    def __init__(self, loader: Iterable[T], device: torch.device, depth: int = 2) -> None:
+        self.loader = loader
+        self.device = device
+        self.depth = max(1, depth)
+
+    def __len__(self) -> int:
+        return len(cast(Sequence[T], self.loader))
+
+    def __iter__(self) -> Iterator[T]:
+        ready: queue.Queue[_Ready | _Failed | None] = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._produce, args=(ready, stop), name="device-prefetcher", daemon=True
+        )
+        thread.start()
+        consumer = torch.cuda.current_stream(self.device) if self.device.type == "cuda" else None
+        try:
+            while (item := ready.get()) is not None:
+                if isinstance(item, _Failed):
+                    raise item.error
+                if consumer is not None and item.event is not None:
+                    consumer.wait_event(item.event)
+                    _record_stream(item.batch, consumer)
+                yield cast(T, item.batch)
+        finally:
+            stop.set()
+            while thread.is_alive():  # Unblock a producer waiting on a full queue
+                try:
+                    ready.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            thread.join()
+
+    def _produce(
+        self, ready: "queue.Queue[_Ready | _Failed | None]", stop: threading.Event
+    ) -> None:
+        cuda = self.device.type == "cuda"
+        if cuda:
+            torch.cuda.set_device(self.device)
+        stream = torch.cuda.Stream(self.device) if cuda else None
+        try:
+            for batch in self.loader:
+                if stop.is_set():
+                    return
+                if stream is not None:
+                    with torch.cuda.stream(stream):
+                        moved = move_to_device(batch, self.device, non_blocking=True)
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                    self._put(ready, stop, _Ready(moved, event))
+                else:
+                    self._put(ready, stop, _Ready(move_to_device(batch, self.device), None))
+        except BaseException as e:
+            self._put(ready, stop, _Failed(e))
+            return
+        self._put(ready, stop, None)
+
+    def _put(
+        self,
+        ready: "queue.Queue[_Ready | _Failed | None]",
+        stop: threading.Event,
+        item: _Ready | _Failed | None,
+    ) -> None:
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
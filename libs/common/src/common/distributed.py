@@ -1,15 +1,20 @@
 import os
+from contextlib import AbstractContextManager, nullcontext
+from typing import NamedTuple, cast
 
 import torch
 import torch.distributed as dist
+from torch.distributed.algorithms.ddp_comm_hooks import default_hooks, powerSGD_hook
+from torch.nn.parallel import DistributedDataParallel as DDP
 
-from common.config import DistributedConfig
+from common.config import CommHook, DistributedConfig
 
 
 def get_distributed_config() -> DistributedConfig:
     rank = int(os.environ.get("RANK", 0))
     world_size = int(os.environ.get("WORLD_SIZE", 1))
     local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
     master_addr = os.environ.get("MASTER_ADDR", "localhost")
     master_port = int(os.environ.get("MASTER_PORT", 29500))
     backend = "nccl" if torch.cuda.is_available() else "gloo"
@@ -17,12 +22,23 @@ def get_distributed_config() -> DistributedConfig:
         rank=rank,
         world_size=world_size,
         local_rank=local_rank,
+        local_world_size=local_world_size,
         backend=backend,
         master_addr=master_addr,
         master_port=master_port,
+        bucket_cap_mb=float(os.environ.get("DDP_BUCKET_CAP_MB", 25)),
+        gradient_as_bucket_view=_env_flag("DDP_GRADIENT_AS_BUCKET_VIEW"),
+        static_graph=_env_flag("DDP_STATIC_GRAPH"),
+        find_unused_parameters=_env_flag("DDP_FIND_UNUSED_PARAMETERS"),
+        comm_hook=cast(CommHook, os.environ.get("DDP_COMM_HOOK", "none")),
+        powersgd_rank=int(os.environ.get("DDP_POWERSGD_RANK", 1)),
     )
 
 
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").lower() in ("1", "true", "yes")
+
+
 def setup_distributed(config: DistributedConfig) -> None:
     os.environ["MASTER_ADDR"] = config.master_addr
     os.environ["MASTER_PORT"] = str(config.master_port)
@@ -35,3 +51,92 @@ def setup_distributed(config: DistributedConfig) -> None:
 
 def cleanup_distributed() -> None:
     dist.destroy_process_group()
+
+
+def wrap_ddp(model: torch.nn.Module, config: DistributedConfig, device: torch.device) -> DDP:
+    """DDP-wrap `model` with the bucketing, graph and compression settings in `config`."""
+    ddp = DDP(
+        model,
+        device_ids=[device] if device.type == "cuda" else None,
+        bucket_cap_mb=config.bucket_cap_mb,
+        gradient_as_bucket_view=config.gradient_as_bucket_view,
+        static_graph=config.static_graph,
+        find_unused_parameters=config.find_unused_parameters,
+    )
+    if config.comm_hook == "fp16":
+        ddp.register_comm_hook(None, default_hooks.fp16_compress_hook)
+    elif config.comm_hook == "bf16":
+        ddp.register_comm_hook(None, default_hooks.bf16_compress_hook)
+    elif config.comm_hook == "powersgd":
+        # The first steps run uncompressed so the error feedback starts from real gradients.
+        state = powerSGD_hook.PowerSGDState(
+            process_group=None,
+            matrix_approximation_rank=config.powersgd_rank,
+            start_powerSGD_iter=10,
+        )
+        ddp.register_comm_hook(state, powerSGD_hook.powerSGD_hook)
+    return ddp
+
+
+def all_reduce_sum(tensor: torch.Tensor) -> torch.Tensor:
+    """Sum `tensor` across ranks in place; a no-op without a process group."""
+    if dist.is_available() and dist.is_initialized():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+class DeviceMean:
+    """Running mean of per-step scalars kept on the device.
+
+    `add` never synchronizes with the host, unlike `loss.item()` every step; the value is
+    read out only when logging.
+    """
+
+    def __init__(self, device: torch.device) -> None:
+        self._sums = torch.zeros(2, dtype=torch.float64, device=device)  # total, count
+
+    def add(self, value: torch.Tensor, weight: float = 1.0) -> None:
+        self._sums[0] += value.detach().to(torch.float64) * weight
+        self._sums[1] += weight
+
+    def reset(self) -> None:
+        self._sums.zero_()
+
+    def local_mean(self) -> float:
+        """Mean of this rank's values (one host sync)."""
+        total, count = self._sums.tolist()
+        return total / count if count else 0.0
+
+    def global_mean(self) -> float:
+        """Mean of every rank's values. A collective: all ranks must call it."""
+        total, count = all_reduce_sum(self._sums.clone()).tolist()
+        return total / count if count else 0.0
+
+
+class MicroStep(NamedTuple):
+    """Where one micro-batch falls in its gradient accumulation group."""
+
+    sync: bool  # Last micro-batch of the group: all-reduce gradients, then step
+    scale: float  # 1 / micro-batches in the group, so accumulated gradients are a mean
+
+
+def micro_steps(num_batches: int, accumulation_steps: int) -> list[MicroStep]:
+    """Accumulation schedule for an epoch of `num_batches` micro-batches.
+
+    Groups are `accumulation_steps` long; a shorter final group is scaled by its own
+    length, so no micro-batch is dropped and every optimizer step sees a mean gradient.
+    """
+    steps: list[MicroStep] = []
+    for start in range(0, num_batches, accumulation_steps):
+        size = min(accumulation_steps, num_batches - start)
+        steps.extend(MicroStep(i == size - 1, 1.0 / size) for i in range(size))
+    return steps
+
+
+def grad_sync(model: DDP, sync: bool) -> AbstractContextManager[None]:
+    """Run forward + backward under `model.no_sync()` unless `sync`.
+
+    Without sync, gradients accumulate locally and no all-reduce is issued; the next
+    synced backward all-reduces the accumulated sum.
+    """
+    return nullcontext() if sync else model.no_sync()
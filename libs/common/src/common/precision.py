@@ -0,0 +1,43 @@
+"""Autocast and loss scaling for the training loops, selected by a Precision string."""
+
+import torch
+
+from common.config import Precision
+
+DTYPES: dict[Precision, torch.dtype] = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+}
+
+
+def resolve_precision(precision: Precision | None, device: torch.device) -> Precision:
+    """None picks bf16 on CUDA and fp32 elsewhere."""
+    if precision is not None:
+        return precision
+    return "bf16" if device.type == "cuda" else "fp32"
+
+
+class MixedPrecision:
+    """Forward passes run under `autocast()`; backward and step go through this object.
+
+    Parameters are never cast, so the optimizer keeps float32 master weights. For fp16
+    a GradScaler scales the loss against gradient underflow and skips steps whose
+    gradients overflowed; for fp32 and bf16 the scaler is disabled and a pass-through.
+    """
+
+    def __init__(self, precision: Precision, device: torch.device) -> None:
+        self.precision = precision
+        self.device = device
+        self.dtype = DTYPES[precision]
+        self.scaler = torch.amp.GradScaler(device.type, enabled=precision == "fp16")
+
+    def autocast(self) -> torch.autocast:
+        return torch.autocast(self.device.type, dtype=self.dtype, enabled=self.precision != "fp32")
+
+    def backward(self, loss: torch.Tensor) -> None:
+        self.scaler.scale(loss).backward()
+
+    def step(self, optimizer: torch.optim.Optimizer) -> None:
+        self.scaler.step(optimizer)
+        self.scaler.update()
@@ -1,37 +1,25 @@
 from pathlib import Path
 
-from google.cloud import aiplatform, storage
+from google.cloud import aiplatform
 
+from common import transfer
 from common.config import VertexConfig
+from common.transfer import is_remote, upload_file
 
 
 def upload_model(checkpoint_path: Path, gcs_uri: str) -> None:
-    if not gcs_uri.startswith("gs://"):
-        raise ValueError("gcs_uri must start with gs://")
-    parts = gcs_uri[5:].split("/", 1)
-    bucket_name = parts[0]
-    blob_path = parts[1] if len(parts) > 1 else str(checkpoint_path.name)
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_path)
-    blob.upload_from_filename(str(checkpoint_path))
+    if not is_remote(gcs_uri):
+        raise ValueError(f"gcs_uri must be a gs:// or file:// URI, got {gcs_uri}")
+    if gcs_uri.endswith("/") or gcs_uri.count("/") < 3:
+        gcs_uri = f"{gcs_uri.rstrip('/')}/{checkpoint_path.name}"
+    upload_file(checkpoint_path, gcs_uri)
 
 
 def upload_directory(local_dir: Path, gcs_uri: str) -> None:
-    """Upload a directory to GCS (for LoRA adapters)."""
-    if not gcs_uri.startswith("gs://"):
-        raise ValueError("gcs_uri must start with gs://")
-    parts = gcs_uri[5:].split("/", 1)
-    bucket_name = parts[0]
-    prefix = parts[1] if len(parts) > 1 else ""
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    for f in local_dir.rglob("*"):
-        if f.is_file():
-            rel = f.relative_to(local_dir)
-            blob_path = f"{prefix.rstrip('/')}/{rel}" if prefix else str(rel)
-            blob = bucket.blob(blob_path)
-            blob.upload_from_filename(str(f))
+    """Upload a directory to GCS (for LoRA adapters), files in parallel."""
+    if not is_remote(gcs_uri):
+        raise ValueError(f"gcs_uri must be a gs:// or file:// URI, got {gcs_uri}")
+    transfer.upload_directory(local_dir, gcs_uri)
 
 
 def register_model(gcs_uri: str, display_name: str, config: VertexConfig) -> None:
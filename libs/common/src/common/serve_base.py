@@ -1,12 +1,15 @@
 """CaseProtocol: interface for case-specific model loading and prediction."""
 
-from typing import Protocol, TypeVar
+import threading
+from collections.abc import Iterator, Sequence
+from typing import Protocol, TypeVar, runtime_checkable
 
 from pydantic import BaseModel
 
-from common.serve_models import PredictRequest, PredictResponse
+from common.serve_models import PredictRequest, PredictResponse, PreparedGeneration
 
 T = TypeVar("T")
+T_contra = TypeVar("T_contra", contravariant=True)
 
 
 class CaseProtocol(Protocol[T]):
@@ -23,22 +26,62 @@ class CaseProtocol(Protocol[T]):
         """Run prediction. Returns Pydantic response model."""
         ...
 
+    def predict_batch(self, model: T, requests: Sequence[BaseModel]) -> list[BaseModel]:
+        """Run one batched forward for several requests. Responses align with requests."""
+        ...
+
+    def warmup(self, model: T) -> None:
+        """Run a dummy prediction so the first real request does not pay for lazy init."""
+        ...
+
+
+@runtime_checkable
+class StreamingCaseProtocol(Protocol[T_contra]):
+    """Optional extension for cases that can stream generated text (lora)."""
+
+    def predict_stream(
+        self, model: T_contra, request: BaseModel, cancel: threading.Event, threads: int = 0
+    ) -> Iterator[str]:
+        """Yield text chunks as they are generated. Stops early once `cancel` is set.
+
+        `threads` > 0 pins the torch intra-op threads of whatever thread runs generation.
+        Raises ValueError if the request has nothing to generate from.
+        """
+        ...
+
+
+@runtime_checkable
+class BinaryCaseProtocol(Protocol[T_contra]):
+    """Optional extension for cases that accept non-JSON bodies on /predict (mnist)."""
+
+    def predict_bytes(self, model: T_contra, body: bytes, content_type: str) -> BaseModel:
+        """Decode a binary body (may carry a batch) and predict.
 
-def download_from_gcs(gcs_path: str, local_path: str) -> str:
-    """Download a file from GCS. Returns local path."""
-    from pathlib import Path
+        Raises ValueError for malformed payloads or unsupported content types.
+        """
+        ...
+
+
+@runtime_checkable
+class TokenGenerationCaseProtocol(Protocol):
+    """Optional extension letting the serve scheduler drive decoding token by token (lora).
+
+    All methods may assume `load` has run.
+    """
+
+    def eos_token_id(self) -> int: ...
+
+    def prepare(self, request: BaseModel) -> PreparedGeneration:
+        """Tokenize the prompt and acquire per-request resources (e.g. a LoRA adapter).
+
+        Raises ValueError if the request has nothing to generate from.
+        """
+        ...
+
+    def release(self, prepared: PreparedGeneration) -> None:
+        """Undo `prepare` once the scheduler is done with the generation."""
+        ...
 
-    from google.cloud import storage
+    def decode(self, token_ids: Sequence[int]) -> str: ...
 
-    if not gcs_path.startswith("gs://"):
-        return gcs_path
-    parts = gcs_path[5:].split("/", 1)
-    bucket_name = parts[0]
-    blob_path = parts[1]
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    local = Path(local_path)
-    local.parent.mkdir(parents=True, exist_ok=True)
-    blob = bucket.blob(blob_path)
-    blob.download_to_filename(str(local))
-    return str(local)
+    def to_response(self, text: str) -> BaseModel: ...
@@ -19,3 +19,18 @@ class PredictRequestBody(BaseModel):
     """Accepts any JSON at route boundary; case validates via RequestModel."""
 
     model_config = ConfigDict(extra="allow")
+
+
+class PredictStreamChunk(BaseModel):
+    """One server-sent event on /predict/stream."""
+
+    text: str
+
+
+class PreparedGeneration(BaseModel):
+    """Tokenized prompt and decoding settings a generative case hands to the serve scheduler."""
+
+    prompt_ids: list[int]
+    max_new_tokens: int
+    temperature: float  # 0 means greedy
+    adapter_name: str | None = None  # None: the model's active adapter
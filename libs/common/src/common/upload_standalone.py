@@ -6,16 +6,19 @@ from pathlib import Path
 from common.config import VertexConfig
 from common.registry import register_model, upload_directory, upload_model
 from common.tracking import end_run
+from common.transfer import copy_prefix
 
 
 def main() -> None:
     if len(sys.argv) < 3:
         raise SystemExit(
             "Usage: python -m common.upload_standalone <checkpoint_path> <run_id> [case=mnist]"
+            " [merged_dir]"
         )
     checkpoint_path = Path(sys.argv[1])
     run_id = sys.argv[2]
     case = sys.argv[3] if len(sys.argv) > 3 else "mnist"
+    merged_dir = Path(sys.argv[4]) if len(sys.argv) > 4 else None
 
     vertex_config = VertexConfig.from_env()
     if not vertex_config:
@@ -26,18 +29,27 @@ def main() -> None:
 
     if case == "lora":
         # LoRA adapters are a directory
+        # latest/ aliases are server-side copies of the run's objects, not second uploads
         if checkpoint_path.is_dir():
             upload_directory(checkpoint_path, f"{base_uri}/{run_id}/")
-            upload_directory(checkpoint_path, f"{base_uri}/lora/latest/")
+            copy_prefix(f"{base_uri}/{run_id}/", f"{base_uri}/lora/latest/")
         else:
             upload_model(checkpoint_path, f"{base_uri}/{run_id}/adapter_model.safetensors")
-            upload_model(checkpoint_path, f"{base_uri}/lora/latest/adapter_model.safetensors")
+            copy_prefix(
+                f"{base_uri}/{run_id}/adapter_model.safetensors",
+                f"{base_uri}/lora/latest/adapter_model.safetensors",
+            )
+        if merged_dir is not None:
+            # Merged inference export (lora.export), served by pointing MODEL_PATH here
+            upload_directory(merged_dir, f"{base_uri}/merged/{run_id}/")
+            copy_prefix(f"{base_uri}/merged/{run_id}/", f"{base_uri}/merged/latest/")
         register_model(f"{base_uri}/{run_id}/", f"lora-{run_id}", vertex_config)
     else:
-        # MNIST: single file
-        upload_model(checkpoint_path, f"{base_uri}/{run_id}/model.pt")
-        upload_model(checkpoint_path, f"{base_uri}/latest/model.pt")
-        register_model(f"{base_uri}/{run_id}/model.pt", f"mnist-{run_id}", vertex_config)
+        # MNIST: single file, named as written (model.safetensors)
+        name = checkpoint_path.name
+        upload_model(checkpoint_path, f"{base_uri}/{run_id}/{name}")
+        copy_prefix(f"{base_uri}/{run_id}/{name}", f"{base_uri}/latest/{name}")
+        register_model(f"{base_uri}/{run_id}/{name}", f"mnist-{run_id}", vertex_config)
 
     end_run()
 
@@ -0,0 +1,46 @@
+"""Model weights on disk: written as safetensors, loaded by memory mapping.
+
+A safetensors file is a JSON header followed by the raw tensor bytes, so loading maps
+the file and views each tensor in place instead of unpickling and copying it. Pages fault
+in as the model first touches them, and since the mapping is never written, every serve
+worker on the host that maps the same file shares one physical copy in the page cache.
+
+Legacy `.pt` state dicts (torch.save zip format) are still read, also memory-mapped.
+"""
+
+import os
+from collections.abc import Mapping
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from safetensors.torch import load_file, save_file
+
+WEIGHTS_SUFFIX = ".safetensors"
+
+
+def save_weights(state_dict: Mapping[str, torch.Tensor], path: Path) -> Path:
+    """Write contiguous CPU copies of `state_dict` to `path` atomically. Returns `path`."""
+    tensors = {name: t.detach().cpu().contiguous() for name, t in state_dict.items()}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    save_file(tensors, str(tmp))
+    os.replace(tmp, path)
+    return path
+
+
+def load_weights(path: str | Path) -> dict[str, torch.Tensor]:
+    """Memory-mapped, CPU tensors of a .safetensors (or legacy .pt) file."""
+    if str(path).endswith(WEIGHTS_SUFFIX):
+        return load_file(str(path), device="cpu")
+    return torch.load(path, map_location="cpu", weights_only=True, mmap=True)
+
+
+def load_module(module: nn.Module, path: str | Path) -> nn.Module:
+    """Point `module`'s parameters at the mapped tensors of `path`, without copying.
+
+    Build `module` under `torch.device("meta")` so no throwaway initial weights are
+    allocated; every parameter and buffer must be in the file (strict load).
+    """
+    module.load_state_dict(load_weights(path), assign=True)
+    return module
@@ -0,0 +1,51 @@
+"""Eviction never removes an entry a reader is still using.
+
+Run: python -m unittest discover libs/common/tests (or pytest)
+"""
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from common.artifact_cache import ArtifactCache, ArtifactCacheConfig
+
+
+class ArtifactCacheEvictionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp())
+        self.uris: list[str] = []
+        for name in ("a", "b", "c"):
+            (self.tmp / "bucket" / name).mkdir(parents=True)
+            (self.tmp / "bucket" / name / "weights.bin").write_bytes(name.encode() * 2**20)
+            self.uris.append(f"file://{self.tmp}/bucket/{name}/")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp)
+
+    def cache(self, revalidate: bool = True) -> ArtifactCache:
+        # Room for one 1 MiB entry: every new fetch tries to evict the others.
+        config = ArtifactCacheConfig(root=self.tmp / "cache", max_mb=1.5, revalidate=revalidate)
+        return ArtifactCache(config)
+
+    def test_entry_in_use_is_not_evicted(self) -> None:
+        cache = self.cache()
+        with cache.use(self.uris[0]) as first:
+            other = self.cache()  # A second loader (another thread or worker)
+            other.fetch(self.uris[1])
+            self.assertEqual((first / "weights.bin").read_bytes()[:1], b"a")
+        # Once released it is evictable again.
+        other.fetch(self.uris[2])
+        self.assertFalse(first.exists())
+
+    def test_evicted_entry_is_fetched_again(self) -> None:
+        cache = self.cache(revalidate=False)
+        first = cache.fetch(self.uris[0])
+        cache.fetch(self.uris[1])  # Evicts the first entry; its ref file remains
+        self.assertFalse(first.exists())
+        with cache.use(self.uris[0]) as again:
+            self.assertEqual((again / "weights.bin").read_bytes()[:1], b"a")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""LRU cache of LoRA adapters hot-swapped onto one shared base model."""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from common.artifact_cache import artifact_path
+from peft import PeftModel
+from pydantic import BaseModel
+
+DEFAULT_ADAPTER = "default"  # Adapter loaded from MODEL_PATH; never evicted.
+
+
+class AdapterCacheConfig(BaseModel):
+    root: str | None = None  # e.g. gs://<bucket>/models, holding <run_id>/ per fine-tune
+    budget_mb: float = 256.0
+
+    @classmethod
+    def from_env(cls) -> "AdapterCacheConfig":
+        return cls(
+            root=os.environ.get("LORA_ADAPTER_ROOT") or None,
+            budget_mb=float(os.environ.get("LORA_ADAPTER_BUDGET_MB", 256.0)),
+        )
+
+
+class AdapterCache:
+    """Loads adapters by run id on demand and evicts least-recently-used ones over budget.
+
+    Adapter weights are tiny next to the base model, so many fine-tunes share one copy of
+    the base weights; peft's `adapter_names` lets one batch mix adapters. Adapters are
+    reference-counted between acquire and release so in-flight generations keep theirs.
+
+    Downloads run outside the cache lock, so requests for loaded adapters are not held up
+    by one being fetched; concurrent requests for the same new adapter share one download.
+    """
+
+    def __init__(self, model: PeftModel | None, config: AdapterCacheConfig) -> None:
+        """`model` is None for merged exports, which can only serve their own adapter."""
+        self._model = model
+        self._config = config
+        self._lock = threading.Lock()
+        self._sizes: OrderedDict[str, int] = OrderedDict()
+        self._in_use: dict[str, int] = {}
+        self._loading: dict[str, Future[None]] = {}
+
+    def acquire(self, run_id: str | None) -> str:
+        """Adapter name to generate with, loading it (and evicting idle ones) if needed.
+
+        Raises ValueError if the adapter cannot be found.
+        """
+        if run_id is None or run_id == DEFAULT_ADAPTER:
+            return DEFAULT_ADAPTER
+        while True:
+            with self._lock:
+                if run_id in self._sizes:
+                    self._sizes.move_to_end(run_id)
+                    self._hold(run_id)
+                    return run_id
+                loading = self._loading.get(run_id)
+                if loading is None:
+                    loading = self._loading[run_id] = Future()
+                    break
+            loading.result()  # Another request is loading it; raises that load's error
+        try:
+            self._load(run_id)
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(run_id, None)
+            loading.set_exception(e)
+            raise
+        loading.set_result(None)
+        return run_id
+
+    def release(self, name: str) -> None:
+        if name == DEFAULT_ADAPTER:
+            return
+        with self._lock:
+            self._in_use[name] -= 1
+            if not self._in_use[name]:
+                del self._in_use[name]
+            self._evict()
+
+    @property
+    def loaded(self) -> list[str]:
+        return list(self._sizes)
+
+    def _hold(self, run_id: str) -> None:
+        self._in_use[run_id] = self._in_use.get(run_id, 0) + 1
+        self._evict()
+
+    def _load(self, run_id: str) -> None:
+        """Download `run_id`, then add it to the model and acquire it under the lock."""
+        root = self._config.root
+        if root is None:
+            raise ValueError("Adapter selection requires LORA_ADAPTER_ROOT")
+        if self._model is None:
+            raise ValueError("Adapter selection is unavailable for merged exports")
+        source = f"{root.rstrip('/')}/{run_id}"
+        try:
+            with artifact_path(source) as path:
+                if not path.is_dir():
+                    raise FileNotFoundError(source)
+                with self._lock:
+                    self._model.load_adapter(str(path), adapter_name=run_id)
+                    self._register(run_id)
+        except FileNotFoundError as e:
+            raise ValueError(f"Unknown adapter: {run_id}") from e
+
+    def _register(self, run_id: str) -> None:
+        """Record a just-loaded adapter's size and hold it. Call with the lock held."""
+        assert self._model is not None
+        marker = f".{run_id}."
+        self._sizes[run_id] = sum(
+            p.numel() * p.element_size()
+            for name, p in self._model.named_parameters()
+            if marker in name
+        )
+        del self._loading[run_id]
+        self._hold(run_id)
+
+    def _evict(self) -> None:
+        """Drop idle adapters, oldest first, until the loaded set fits the budget."""
+        budget = int(self._config.budget_mb * 1024 * 1024)
+        total = sum(self._sizes.values())
+        for name in list(self._sizes):
+            if total <= budget:
+                return
+            if name in self._in_use:
+                continue
+            total -= self._sizes.pop(name)
+            assert self._model is not None  # Only peft models ever load extra adapters
+            self._model.delete_adapter(name)
@@ -0,0 +1,123 @@
+"""Benchmark LoRA inference variants: peft (base + adapter), merged, merged + int8.
+
+Each variant runs in a fresh subprocess so resident memory is measured in isolation.
+
+Usage: python -m lora.bench_export <adapter_dir> [--tokens 64] [--runs 3]
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Literal
+
+import torch
+from pydantic import BaseModel
+
+from lora.config import TrainingConfig
+
+Variant = Literal["peft", "merged", "int8"]
+VARIANTS: list[Variant] = ["peft", "merged", "int8"]
+PROMPT = "The history of distributed training begins with"
+
+
+class BenchResult(BaseModel):
+    variant: str
+    load_s: float
+    rss_mb: float
+    tokens_per_s: float
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process (Linux), in MiB."""
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_variant(
+    variant: Variant, adapter_dir: Path, export_dir: Path, base_model: str, tokens: int, runs: int
+) -> BenchResult:
+    from peft import PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from lora.export import CausalLM, load_export
+
+    start = time.perf_counter()
+    model: PeftModel | CausalLM
+    if variant == "peft":
+        base = AutoModelForCausalLM.from_pretrained(base_model, torch_dtype=torch.float32)
+        model = PeftModel.from_pretrained(base, str(adapter_dir))
+        model.eval()
+    else:
+        model = load_export(export_dir, quantize="int8" if variant == "int8" else "none")
+    load_s = time.perf_counter() - start
+
+    tokenizer = AutoTokenizer.from_pretrained(base_model)
+    inputs = tokenizer(PROMPT, return_tensors="pt")
+    kwargs = {"max_new_tokens": tokens, "min_new_tokens": tokens, "do_sample": False}
+    with torch.no_grad():
+        model.generate(**inputs, **kwargs)  # warmup
+        start = time.perf_counter()
+        for _ in range(runs):
+            model.generate(**inputs, **kwargs)
+        elapsed = time.perf_counter() - start
+    return BenchResult(
+        variant=variant,
+        load_s=load_s,
+        rss_mb=rss_mb(),
+        tokens_per_s=tokens * runs / elapsed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark peft vs merged vs int8 inference")
+    parser.add_argument("adapter_dir", type=Path)
+    parser.add_argument("--base-model", default=TrainingConfig().model_name)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--export-dir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:  # Child process: measure one variant and report as JSON
+        result = run_variant(
+            args.variant, args.adapter_dir, args.export_dir, args.base_model, args.tokens, args.runs
+        )
+        print(result.model_dump_json())
+        return
+
+    from lora.export import export_adapter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export_dir = export_adapter(args.adapter_dir, Path(tmp) / "merged", args.base_model)
+        results: list[BenchResult] = []
+        for variant in VARIANTS:
+            out = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "lora.bench_export",
+                    str(args.adapter_dir),
+                    f"--base-model={args.base_model}",
+                    f"--tokens={args.tokens}",
+                    f"--runs={args.runs}",
+                    f"--variant={variant}",
+                    f"--export-dir={export_dir}",
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            results.append(BenchResult.model_validate_json(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'variant':<8} {'load_s':>8} {'rss_mb':>9} {'tok/s':>8}")
+    for r in results:
+        print(f"{r.variant:<8} {r.load_s:>8.2f} {r.rss_mb:>9.0f} {r.tokens_per_s:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
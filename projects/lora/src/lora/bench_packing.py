@@ -0,0 +1,113 @@
+"""Compare LoRA batching modes: pad ratio over an epoch and training tokens/sec.
+
+padded (every example to max_length, the old behaviour), bucketed (length-bucketed
+batches padded to their longest example) and packed (documents concatenated into full
+sequences). tokens/sec counts real (non-pad) tokens through forward + backward + step.
+
+Usage: python -m lora.bench_packing [--steps 20] [--max-length 512] [--batch-size 4]
+"""
+
+import argparse
+import time
+from typing import Literal
+
+import torch
+from peft import LoraConfig, TaskType, get_peft_model
+from pydantic import BaseModel
+from transformers import AutoModelForCausalLM, AutoTokenizer, PreTrainedTokenizerBase
+
+from lora.config import LoRAConfig, TrainingConfig
+from lora.data import get_dataloader
+
+Batching = Literal["padded", "bucketed", "packed"]
+MODES: list[Batching] = ["padded", "bucketed", "packed"]
+
+
+class BenchResult(BaseModel):
+    batching: str
+    batches: int
+    pad_ratio: float
+    tokens_per_s: float
+
+
+def bench(
+    config: TrainingConfig,
+    model: torch.nn.Module,
+    tokenizer: PreTrainedTokenizerBase,
+    steps: int,
+    device: torch.device,
+) -> BenchResult:
+    loader = get_dataloader(config, tokenizer, rank=0, world_size=1)
+    pad = total = 0
+    for batch in loader:
+        total += batch.attention_mask.numel()
+        pad += int((batch.attention_mask == 0).sum())
+
+    optimizer = torch.optim.AdamW(model.parameters(), lr=config.lr)
+    model.train()
+    tokens = 0
+    batches = iter(loader)
+    start = 0.0
+    for step in range(steps + 1):  # Step 0 warms up and is not timed
+        batch = next(batches, None)
+        if batch is None:
+            batches = iter(loader)
+            batch = next(batches)
+        if step == 1:
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+        optimizer.zero_grad()
+        model(**batch.model_inputs(device)).loss.backward()
+        optimizer.step()
+        if step:
+            tokens += int(batch.attention_mask.sum())
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    return BenchResult(
+        batching=config.batching,
+        batches=len(loader),
+        pad_ratio=pad / total if total else 0.0,
+        tokens_per_s=tokens / elapsed if elapsed else 0.0,
+    )
+
+
+def main() -> None:
+    defaults = TrainingConfig()
+    parser = argparse.ArgumentParser(description="Benchmark LoRA batching modes")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--max-length", type=int, default=defaults.max_length)
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+    parser.add_argument("--model", default=defaults.model_name)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    base = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32)
+    lora_cfg = LoRAConfig(model_name=args.model)
+    peft_config = LoraConfig(
+        r=lora_cfg.r,
+        lora_alpha=lora_cfg.lora_alpha,
+        target_modules=lora_cfg.target_modules,
+        lora_dropout=lora_cfg.lora_dropout,
+        task_type=TaskType.CAUSAL_LM,
+    )
+    model = get_peft_model(base, peft_config).to(device)
+
+    print(f"{'batching':>9} {'batches':>8} {'pad ratio':>10} {'tokens/s':>10}")
+    for mode in MODES:
+        config = defaults.model_copy(
+            update={
+                "model_name": args.model,
+                "max_length": args.max_length,
+                "batch_size": args.batch_size,
+                "batching": mode,
+            }
+        )
+        r = bench(config, model, tokenizer, args.steps, device)
+        print(f"{r.batching:>9} {r.batches:>8} {r.pad_ratio:>10.3f} {r.tokens_per_s:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
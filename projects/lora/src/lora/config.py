@@ -1,5 +1,7 @@
 from pathlib import Path
+from typing import Literal
 
+from common.config import CheckpointConfig, DataLoaderConfig, Precision
 from pydantic import BaseModel
 
 
@@ -21,3 +23,25 @@ class TrainingConfig(BaseModel):
     checkpoint_dir: Path = Path("./checkpoints")
     dataset_name: str = "wikitext"
     dataset_config: str = "wikitext-2-raw-v1"
+    max_examples: int | None = 1000  # Non-empty train texts to use; None for all
+    # padded: every example to max_length. bucketed: length-bucketed batches padded to their
+    # longest example. packed: documents concatenated into full max_length sequences.
+    batching: Literal["padded", "bucketed", "packed"] = "bucketed"
+    pack_document_mask: bool = True  # packed: attend only within each document
+    loader: DataLoaderConfig = DataLoaderConfig()
+    checkpoint: CheckpointConfig = CheckpointConfig()
+    # Autocast mode (common.config.Precision); None is bf16 on CUDA and fp32 on CPU. The frozen
+    # base weights are loaded in the autocast dtype; the adapter weights stay float32.
+    precision: Precision | None = None
+    # Recompute activations during backward instead of keeping them: much less memory for
+    # roughly one extra forward pass per step.
+    gradient_checkpointing: bool = False
+    # Probe micro-batch sizes before training and use the largest whose peak memory (RSS on
+    # CPU, allocated VRAM on CUDA) fits, keeping batch_size * accumulation_steps.
+    memory_budget_mb: int | None = None
+    # Micro-batches per optimizer step; gradients are all-reduced once per step, so the
+    # effective batch is batch_size * accumulation_steps * world_size.
+    accumulation_steps: int = 1
+    log_interval: int = 10  # Optimizer steps between rank-0 loss prints; 0 logs epochs only
+    # Also write a merged (optionally int8) inference export next to the adapter.
+    export: Literal["none", "merged", "int8"] = "none"
@@ -1,96 +1,144 @@
-"""LoRA dataloader — strict typing, Pydantic models only."""
+"""LoRA dataloader — strict typing; datasets yield tensor views, batches are TokenizedBatch."""
 
 from __future__ import annotations
 
+import itertools
 from collections.abc import Sequence
+from typing import NamedTuple
 
+import numpy as np
+import torch
 from common.dataloader import create_distributed_dataloader
-from datasets import load_dataset
 from torch.utils.data import DataLoader, Dataset
-from transformers import AutoTokenizer
+from transformers import PreTrainedTokenizerBase
 
 from lora.config import TrainingConfig
-from lora.models import TokenizedBatch, TokenizedExample
+from lora.models import TokenizedBatch
+from lora.token_cache import TokenCache, load_token_cache
 
 
-class TextDataset(Dataset[TokenizedExample]):
-    """Dataset of tokenized text examples."""
+class PackedWindow(NamedTuple):
+    """One packed sequence: token ids and each token's position within its document."""
 
-    def __init__(
-        self,
-        tokenizer: AutoTokenizer,
-        dataset_name: str,
-        dataset_config: str,
-        max_length: int,
-    ) -> None:
-        self.tokenizer = tokenizer
+    input_ids: torch.Tensor
+    position_ids: torch.Tensor
+
+
+class TextDataset(Dataset[torch.Tensor]):
+    """One unpadded example per document: an int32 view into the TokenCache memmap."""
+
+    def __init__(self, cache: TokenCache) -> None:
+        self.tokens = torch.from_numpy(cache.tokens)
+        self.offsets = cache.offsets.tolist()
+
+    @property
+    def lengths(self) -> list[int]:
+        return [b - a for a, b in itertools.pairwise(self.offsets)]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> torch.Tensor:
+        return self.tokens[self.offsets[idx] : self.offsets[idx + 1]]
+
+
+class PackedDataset(Dataset[PackedWindow]):
+    """Consecutive max_length windows over all documents concatenated back to back.
+
+    Position ids restart at each document (a window may start mid-document); they are
+    computed once for the whole token stream, so items are two views.
+    """
+
+    def __init__(self, cache: TokenCache, max_length: int) -> None:
+        self.tokens = torch.from_numpy(cache.tokens)
         self.max_length = max_length
-        raw = load_dataset(dataset_name, dataset_config, split="train")
-        self.examples: list[TokenizedExample] = []
-        for item in raw:
-            text = item.get("text", "")
-            if not text.strip():
-                continue
-            enc = tokenizer(
-                text,
-                truncation=True,
-                max_length=max_length,
-                padding="max_length",
-                return_tensors=None,
-            )
-            labels = list(enc["input_ids"])
-            for i in range(len(labels)):
-                if enc["attention_mask"][i] == 0:
-                    labels[i] = -100
-            self.examples.append(
-                TokenizedExample(
-                    input_ids=enc["input_ids"],
-                    attention_mask=enc["attention_mask"],
-                    labels=labels,
-                )
-            )
-            if len(self.examples) >= 1000:
-                break
+        offsets = torch.from_numpy(np.asarray(cache.offsets))
+        starts = torch.repeat_interleave(offsets[:-1], offsets.diff())
+        self.positions = (torch.arange(len(self.tokens)) - starts).to(torch.int32)
 
     def __len__(self) -> int:
-        return len(self.examples)
+        return len(self.tokens) // self.max_length
 
-    def __getitem__(self, idx: int) -> TokenizedExample:
-        return self.examples[idx]
+    def __getitem__(self, idx: int) -> PackedWindow:
+        window = slice(idx * self.max_length, (idx + 1) * self.max_length)
+        return PackedWindow(self.tokens[window], self.positions[window])
 
 
-def collate_fn(batch: Sequence[TokenizedExample]) -> TokenizedBatch:
-    """Collate TokenizedExamples into a TokenizedBatch of tensors."""
-    import torch
+class PadCollator:
+    """Right-pad token views to the longest one (or `pad_to`) and build the batch tensors."""
+
+    def __init__(self, pad_token_id: int, pad_to: int | None = None) -> None:
+        self.pad_token_id = pad_token_id
+        self.pad_to = pad_to
+
+    def __call__(self, batch: Sequence[torch.Tensor]) -> TokenizedBatch:
+        lengths = torch.tensor([len(t) for t in batch])
+        width = self.pad_to or int(lengths.max())
+        input_ids = torch.full((len(batch), width), self.pad_token_id, dtype=torch.long)
+        for row, tokens in enumerate(batch):
+            input_ids[row, : len(tokens)] = tokens
+        attention_mask = (torch.arange(width) < lengths.unsqueeze(1)).long()
+        return TokenizedBatch.model_construct(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            labels=input_ids.masked_fill(attention_mask == 0, -100),
+            position_ids=None,
+        )
 
-    input_ids = [b.input_ids for b in batch]
-    attention_mask = [b.attention_mask for b in batch]
-    labels = [b.labels for b in batch]
-    return TokenizedBatch(
-        input_ids=torch.tensor(input_ids, dtype=torch.long),
-        attention_mask=torch.tensor(attention_mask, dtype=torch.long),
-        labels=torch.tensor(labels, dtype=torch.long),
-    )
+
+class PackedCollator:
+    """Stack packed windows. A document's first token is never a target, so the loss never
+    crosses a document boundary; with `document_mask` the position ids are passed on so
+    attention stays within each document too."""
+
+    def __init__(self, document_mask: bool) -> None:
+        self.document_mask = document_mask
+
+    def __call__(self, batch: Sequence[PackedWindow]) -> TokenizedBatch:
+        input_ids = torch.stack([w.input_ids for w in batch]).long()
+        positions = torch.stack([w.position_ids for w in batch]).long()
+        return TokenizedBatch.model_construct(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            labels=input_ids.masked_fill(positions == 0, -100),
+            position_ids=positions if self.document_mask else None,
+        )
 
 
 def get_dataloader(
     config: TrainingConfig,
-    tokenizer: AutoTokenizer,
+    tokenizer: PreTrainedTokenizerBase,
     rank: int,
     world_size: int,
+    local_rank: int = 0,
+    local_world_size: int = 1,
 ) -> DataLoader[TokenizedBatch]:
-    """Create distributed dataloader for LoRA training."""
-    dataset = TextDataset(
-        tokenizer=tokenizer,
-        dataset_name=config.dataset_name,
-        dataset_config=config.dataset_config,
-        max_length=config.max_length,
-    )
+    """Create distributed dataloader for LoRA training (see TrainingConfig.batching)."""
+    cache = load_token_cache(config, tokenizer, local_rank)
+    pad_token_id = cache.info.pad_token_id
+    num_workers = config.loader.resolved_num_workers(local_world_size)
+    pin_memory = config.loader.resolved_pin_memory()
+    if config.batching == "packed":
+        return create_distributed_dataloader(
+            PackedDataset(cache, config.max_length),
+            batch_size=config.batch_size,
+            rank=rank,
+            world_size=world_size,
+            collate_fn=PackedCollator(config.pack_document_mask),
+            num_workers=num_workers,
+            pin_memory=pin_memory,
+            prefetch_factor=config.loader.prefetch_factor,
+        )
+    dataset = TextDataset(cache)
+    bucketed = config.batching == "bucketed"
     return create_distributed_dataloader(
         dataset,
         batch_size=config.batch_size,
         rank=rank,
         world_size=world_size,
-        collate_fn=collate_fn,
-        num_workers=0,
+        collate_fn=PadCollator(pad_token_id, pad_to=None if bucketed else config.max_length),
+        num_workers=num_workers,
+        lengths=dataset.lengths if bucketed else None,
+        pin_memory=pin_memory,
+        prefetch_factor=config.loader.prefetch_factor,
     )
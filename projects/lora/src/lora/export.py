@@ -0,0 +1,100 @@
+"""Merge a LoRA adapter into its base weights for inference, optionally int8-quantized.
+
+A merged model runs plain Linear layers instead of base + LoRA matmuls on every forward.
+int8 dynamic quantization is applied at load time (it is cheap and deterministic), so the
+export stays a regular safetensors checkpoint plus an `export.json` marker.
+
+Usage: python -m lora.export <adapter_dir> <out_dir> [--int8] [--base-model NAME]
+"""
+
+import argparse
+from pathlib import Path
+from typing import Literal, Protocol, cast
+
+import torch
+import torch.nn as nn
+from peft import PeftModel
+from pydantic import BaseModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+EXPORT_INFO = "export.json"
+
+
+class CausalLM(Protocol):
+    """What serving needs from a merged (possibly quantized) model."""
+
+    def generate(self, **kwargs: object) -> torch.Tensor: ...
+
+
+class ExportInfo(BaseModel):
+    base_model: str
+    quantize: Literal["none", "int8"] = "none"
+
+
+def is_export(path: Path) -> bool:
+    return (path / EXPORT_INFO).is_file()
+
+
+def export_merged(
+    model: PeftModel,
+    out_dir: Path,
+    base_model: str,
+    quantize: Literal["none", "int8"] = "none",
+) -> Path:
+    """Fold the adapter into the base weights (fp32) and save alongside the tokenizer.
+
+    Mutates `model`: the LoRA layers are unloaded.
+    """
+    merged = model.merge_and_unload().to(torch.float32)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    merged.save_pretrained(out_dir, safe_serialization=True)
+    AutoTokenizer.from_pretrained(base_model).save_pretrained(out_dir)
+    info = ExportInfo(base_model=base_model, quantize=quantize)
+    (out_dir / EXPORT_INFO).write_text(info.model_dump_json(indent=2))
+    return out_dir
+
+
+def export_adapter(
+    adapter_dir: Path,
+    out_dir: Path,
+    base_model: str,
+    quantize: Literal["none", "int8"] = "none",
+) -> Path:
+    """Load base + adapter from disk and export the merged model."""
+    base = AutoModelForCausalLM.from_pretrained(base_model, torch_dtype=torch.float32)
+    model = PeftModel.from_pretrained(base, str(adapter_dir))
+    return export_merged(model, out_dir, base_model, quantize)
+
+
+def load_export(path: Path, quantize: Literal["none", "int8"] | None = None) -> CausalLM:
+    """Load a merged export for CPU inference, applying int8 dynamic quantization if marked.
+
+    `quantize` overrides the mode recorded in export.json (used by lora.bench_export).
+    """
+    info = ExportInfo.model_validate_json((path / EXPORT_INFO).read_text())
+    model = AutoModelForCausalLM.from_pretrained(str(path), torch_dtype="auto")  # Mapped, no copy
+    if (quantize or info.quantize) == "int8":
+        model = torch.ao.quantization.quantize_dynamic(  # pyright: ignore[reportDeprecated]
+            model, {nn.Linear}, dtype=torch.qint8
+        )
+    model.eval()
+    return cast(CausalLM, model)
+
+
+def main() -> None:
+    from lora.config import TrainingConfig
+
+    parser = argparse.ArgumentParser(description="Merge a LoRA adapter into its base model")
+    parser.add_argument("adapter_dir", type=Path)
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--int8", action="store_true", help="Quantize Linear layers at load")
+    parser.add_argument("--base-model", default=TrainingConfig().model_name)
+    args = parser.parse_args()
+    out = export_adapter(
+        args.adapter_dir, args.out_dir, args.base_model, "int8" if args.int8 else "none"
+    )
+    print(f"Exported merged model to {out}")
+
+
+if __name__ == "__main__":
+    main()
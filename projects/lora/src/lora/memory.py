@@ -0,0 +1,89 @@
+"""Fit-to-memory probe: pick the largest micro-batch whose training step fits a budget.
+
+Peak memory is the process peak RSS on CPU (getrusage, which never decreases, so sizes
+are probed in ascending order) and the peak allocated VRAM on CUDA. Probes use
+worst-case full `max_length` sequences of random tokens and run forward + backward only;
+the adapter optimizer state they skip is small next to activations.
+"""
+
+import resource
+import sys
+
+import torch
+import torch.distributed as dist
+from common.precision import MixedPrecision
+
+from lora.config import TrainingConfig
+
+PROBE_STEPS = 2
+
+
+def peak_memory_mb(device: torch.device) -> float:
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10  # bytes vs KiB
+
+
+def _probe(
+    model: torch.nn.Module,
+    micro_batch: int,
+    config: TrainingConfig,
+    amp: MixedPrecision,
+    vocab_size: int,
+    device: torch.device,
+) -> float:
+    """Peak memory (MiB) of PROBE_STEPS forward + backward passes at `micro_batch`."""
+    if device.type == "cuda":
+        torch.cuda.empty_cache()
+        torch.cuda.reset_peak_memory_stats(device)
+    model.train()
+    input_ids = torch.randint(vocab_size, (micro_batch, config.max_length), device=device)
+    try:
+        for _ in range(PROBE_STEPS):
+            with amp.autocast():
+                loss = model(input_ids=input_ids, labels=input_ids, use_cache=False).loss
+            amp.backward(loss)
+            model.zero_grad(set_to_none=True)
+    except torch.OutOfMemoryError:
+        model.zero_grad(set_to_none=True)
+        return float("inf")
+    return peak_memory_mb(device)
+
+
+def fit_to_memory(
+    model: torch.nn.Module,
+    config: TrainingConfig,
+    amp: MixedPrecision,
+    vocab_size: int,
+    device: torch.device,
+    rank: int = 0,
+) -> TrainingConfig:
+    """Return `config` with the largest batch_size under `config.memory_budget_mb`.
+
+    The effective batch (batch_size * accumulation_steps) is kept: candidates are its
+    divisors, and accumulation_steps grows as batch_size shrinks. Every rank probes and
+    all ranks adopt the smallest choice, since DDP needs the same schedule everywhere.
+    Call before wrapping the model in DDP.
+    """
+    budget = config.memory_budget_mb
+    if budget is None:
+        return config
+    effective = config.batch_size * config.accumulation_steps
+    chosen = 1
+    for micro_batch in (d for d in range(1, effective + 1) if effective % d == 0):
+        peak = _probe(model, micro_batch, config, amp, vocab_size, device)
+        if rank == 0:
+            print(f"  memory probe: batch_size={micro_batch} peak={peak:.0f} MiB")
+        if peak > budget:
+            break
+        chosen = micro_batch
+    if dist.is_available() and dist.is_initialized():
+        agreed = torch.tensor(chosen, device=device)
+        dist.all_reduce(agreed, op=dist.ReduceOp.MIN)
+        chosen = int(agreed.item())
+    if rank == 0:
+        print(f"Fit to {budget} MiB: batch_size={chosen} accumulation_steps={effective // chosen}")
+    return config.model_copy(
+        update={"batch_size": chosen, "accumulation_steps": effective // chosen}
+    )
@@ -6,21 +6,39 @@ import torch
 from pydantic import BaseModel, ConfigDict
 
 
-class TokenizedExample(BaseModel):
-    """Single tokenized example: input_ids, attention_mask, labels."""
-
-    model_config = ConfigDict(frozen=True)
-
-    input_ids: list[int]
-    attention_mask: list[int]
-    labels: list[int]
-
-
 class TokenizedBatch(BaseModel):
-    """Batched tokenized tensors for model forward pass."""
+    """Batched tokenized tensors for model forward pass.
+
+    Collators build it with model_construct: the tensors are made by the collator itself,
+    so per-step validation would only cost time.
+    """
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     input_ids: torch.Tensor
     attention_mask: torch.Tensor
     labels: torch.Tensor
+    position_ids: torch.Tensor | None = None
+
+    def pin_memory(self) -> TokenizedBatch:
+        """Page-locked copy; DataLoader(pin_memory=True) calls this on custom batch types."""
+        return TokenizedBatch.model_construct(
+            input_ids=self.input_ids.pin_memory(),
+            attention_mask=self.attention_mask.pin_memory(),
+            labels=self.labels.pin_memory(),
+            position_ids=None if self.position_ids is None else self.position_ids.pin_memory(),
+        )
+
+    def model_inputs(self, device: torch.device) -> dict[str, torch.Tensor | bool]:
+        """Forward kwargs on `device`. Packed batches pass position ids and no padding mask
+        (or KV cache), so the model derives per-document attention from where they restart."""
+        inputs: dict[str, torch.Tensor | bool] = {
+            "input_ids": self.input_ids.to(device),
+            "labels": self.labels.to(device),
+        }
+        if self.position_ids is not None:
+            inputs["position_ids"] = self.position_ids.to(device)
+            inputs["use_cache"] = False
+        else:
+            inputs["attention_mask"] = self.attention_mask.to(device)
+        return inputs
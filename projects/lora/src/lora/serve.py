@@ -1,13 +1,35 @@
 """LoraCase implements CaseProtocol for the reusable serve app."""
 
-from pathlib import Path
+import os
+import threading
+from collections.abc import Iterator, Sequence
 
 import torch
-from common.serve_models import PredictRequest, PredictResponse
+from common.artifact_cache import artifact_path
+from common.precision import DTYPES
+from common.serve_models import PredictRequest, PredictResponse, PreparedGeneration
 from peft import PeftModel
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from pydantic import Field
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    GenerationConfig,
+    PreTrainedTokenizerBase,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
+
+from lora.adapters import DEFAULT_ADAPTER, AdapterCache, AdapterCacheConfig
+from lora.export import CausalLM, is_export, load_export
 
 DEFAULT_MODEL = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+# Base model weights dtype: "auto" keeps the checkpoint's own dtype, so from_pretrained maps
+# the safetensors shards in place; fp32/bf16/fp16 convert, which copies every weight.
+BASE_DTYPE = os.environ.get("LORA_BASE_DTYPE", "auto")
+
+# Base model + adapter (PeftModel), or a merged lora.export (a plain causal LM)
+LoraModel = PeftModel | CausalLM
 
 
 class LoraPredictRequest(PredictRequest):
@@ -15,6 +37,7 @@ class LoraPredictRequest(PredictRequest):
 
     prompt: str = ""
     text: str = ""
+    adapter: str | None = Field(default=None, pattern=r"^[A-Za-z0-9_-]+$")  # run id
 
 
 class LoraPredictResponse(PredictResponse):
@@ -24,57 +47,212 @@ class LoraPredictResponse(PredictResponse):
     error: str | None = None
 
 
+class _CancelCriteria(StoppingCriteria):
+    """Stops generate at the next decode step once the client has gone away."""
+
+    def __init__(self, cancel: threading.Event) -> None:
+        self.cancel = cancel
+
+    def __call__(
+        self, input_ids: torch.LongTensor, scores: object, **kwargs: object
+    ) -> torch.BoolTensor:
+        stop = torch.full((input_ids.shape[0],), self.cancel.is_set(), dtype=torch.bool)
+        return stop.to(input_ids.device)  # type: ignore[return-value]
+
+
+def _base_dtype() -> torch.dtype | str:
+    if BASE_DTYPE == "auto":
+        return "auto"
+    if BASE_DTYPE not in DTYPES:
+        raise ValueError(f"LORA_BASE_DTYPE must be auto, fp32, bf16 or fp16, got {BASE_DTYPE}")
+    return DTYPES[BASE_DTYPE]
+
+
 class LoraCase:
     RequestModel = LoraPredictRequest
     ResponseModel = LoraPredictResponse
 
-    def load(self, path: str) -> PeftModel:
-        if path.startswith("gs://"):
-            local_dir = Path("/tmp/lora_adapters")
-            local_dir.mkdir(parents=True, exist_ok=True)
-            from google.cloud import storage
-
-            parts = path[5:].split("/", 1)
-            bucket_name = parts[0]
-            prefix = parts[1].rstrip("/") + "/"
-            client = storage.Client()
-            bucket = client.bucket(bucket_name)
-            for blob in bucket.list_blobs(prefix=prefix):
-                rel = blob.name[len(prefix) :]
-                if not rel:
-                    continue
-                dest = local_dir / rel
-                dest.parent.mkdir(parents=True, exist_ok=True)
-                blob.download_to_filename(str(dest))
-            adapter_path = str(local_dir)
-        else:
-            adapter_path = path
-        base = AutoModelForCausalLM.from_pretrained(
-            DEFAULT_MODEL,
-            torch_dtype=torch.float32,
-            device_map="auto" if torch.cuda.is_available() else None,
+    def __init__(self) -> None:
+        self._tokenizer: PreTrainedTokenizerBase | None = None
+        self._generation_config: GenerationConfig | None = None
+        self._adapters: AdapterCache | None = None
+
+    @property
+    def tokenizer(self) -> PreTrainedTokenizerBase:
+        """Tokenizer built once in load; left-padded so prompts batch for generate."""
+        if self._tokenizer is None:
+            raise RuntimeError("LoraCase.load must run before predict")
+        return self._tokenizer
+
+    @property
+    def generation_config(self) -> GenerationConfig:
+        if self._generation_config is None:
+            raise RuntimeError("LoraCase.load must run before predict")
+        return self._generation_config
+
+    @property
+    def adapters(self) -> AdapterCache:
+        if self._adapters is None:
+            raise RuntimeError("LoraCase.load must run before predict")
+        return self._adapters
+
+    def load(self, path: str) -> LoraModel:
+        model: LoraModel
+        # Everything read from the adapter/export directory is read inside the block, so
+        # the artifact cache cannot evict it midway.
+        with artifact_path(path) as adapter_dir:
+            tokenizer_source = DEFAULT_MODEL
+            if is_export(adapter_dir):
+                model = load_export(adapter_dir)
+                tokenizer_source = str(adapter_dir)
+            else:
+                base = AutoModelForCausalLM.from_pretrained(
+                    DEFAULT_MODEL,
+                    torch_dtype=_base_dtype(),
+                    device_map="auto" if torch.cuda.is_available() else None,
+                )
+                model = PeftModel.from_pretrained(base, str(adapter_dir))
+                model.eval()
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_source)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        self._tokenizer = tokenizer
+        self._generation_config = GenerationConfig(
+            max_new_tokens=64,
+            do_sample=True,
+            temperature=0.7,
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id,
         )
-        model = PeftModel.from_pretrained(base, adapter_path)
-        model.eval()
+        peft_model = model if isinstance(model, PeftModel) else None
+        self._adapters = AdapterCache(peft_model, AdapterCacheConfig.from_env())
         return model
 
-    def predict(self, model: PeftModel, request: LoraPredictRequest) -> LoraPredictResponse:
-        tokenizer = AutoTokenizer.from_pretrained(DEFAULT_MODEL)
+    def warmup(self, model: LoraModel) -> None:
+        self.predict(model, LoraPredictRequest(prompt="Hello"))
+
+    def eos_token_id(self) -> int:
+        return int(self.generation_config.eos_token_id)
+
+    def prepare(self, request: LoraPredictRequest) -> PreparedGeneration:
         prompt = request.prompt or request.text
         if not prompt:
-            return LoraPredictResponse(error="No prompt or text provided")
+            raise ValueError("No prompt or text provided")
+        cfg = self.generation_config
+        prompt_ids = list(self.tokenizer(prompt)["input_ids"])
+        adapter = self.adapters.acquire(request.adapter)  # Last: nothing after it can raise
+        return PreparedGeneration(
+            prompt_ids=prompt_ids,
+            max_new_tokens=int(cfg.max_new_tokens),
+            temperature=float(cfg.temperature) if cfg.do_sample else 0.0,
+            adapter_name=None if adapter == DEFAULT_ADAPTER else adapter,
+        )
+
+    def release(self, prepared: PreparedGeneration) -> None:
+        if prepared.adapter_name is not None:
+            self.adapters.release(prepared.adapter_name)
+
+    def decode(self, token_ids: Sequence[int]) -> str:
+        return self.tokenizer.batch_decode([list(token_ids)], skip_special_tokens=True)[0]
+
+    def to_response(self, text: str) -> LoraPredictResponse:
+        return LoraPredictResponse(output=text.strip())
+
+    def predict(self, model: LoraModel, request: LoraPredictRequest) -> LoraPredictResponse:
+        return self.predict_batch(model, [request])[0]
+
+    def predict_batch(
+        self, model: LoraModel, requests: Sequence[LoraPredictRequest]
+    ) -> list[LoraPredictResponse]:
+        """Left-pad all prompts into one batch and run a single generate call.
+
+        Requests for different adapters share the batch via peft's `adapter_names`.
+        """
+        tokenizer = self.tokenizer
+        responses = [LoraPredictResponse(error="No prompt or text provided") for _ in requests]
+        indices: list[int] = []
+        adapters: list[str] = []
+        try:
+            for i, request in enumerate(requests):
+                if not (request.prompt or request.text):
+                    continue
+                try:
+                    adapters.append(self.adapters.acquire(request.adapter))
+                except ValueError as e:
+                    responses[i] = LoraPredictResponse(error=str(e))
+                    continue
+                indices.append(i)
+            if not indices:
+                return responses
+            prompts = [requests[i].prompt or requests[i].text for i in indices]
+            inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+            if torch.cuda.is_available():
+                inputs = {k: v.cuda() for k, v in inputs.items()}
+            with torch.no_grad():
+                if all(name == DEFAULT_ADAPTER for name in adapters):
+                    outputs = model.generate(**inputs, generation_config=self.generation_config)
+                else:
+                    outputs = model.generate(
+                        **inputs, generation_config=self.generation_config, adapter_names=adapters
+                    )
+        finally:
+            for name in adapters:
+                self.adapters.release(name)
+        prompt_len = inputs["input_ids"].shape[1]
+        texts = tokenizer.batch_decode(outputs[:, prompt_len:], skip_special_tokens=True)
+        for i, output in zip(indices, texts, strict=True):
+            responses[i] = LoraPredictResponse(output=output.strip())
+        return responses
+
+    def predict_stream(
+        self,
+        model: LoraModel,
+        request: LoraPredictRequest,
+        cancel: threading.Event,
+        threads: int = 0,
+    ) -> Iterator[str]:
+        """Run generate on a background thread and yield decoded text per decode step."""
+        prompt = request.prompt or request.text
+        if not prompt:
+            raise ValueError("No prompt or text provided")
+        tokenizer = self.tokenizer
         inputs = tokenizer(prompt, return_tensors="pt")
         if torch.cuda.is_available():
             inputs = {k: v.cuda() for k, v in inputs.items()}
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=64,
-                do_sample=True,
-                temperature=0.7,
-                pad_token_id=tokenizer.eos_token_id,
-            )
-        output = tokenizer.decode(
-            outputs[0][inputs["input_ids"].shape[1] :], skip_special_tokens=True
-        )
-        return LoraPredictResponse(output=output.strip())
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+        errors: list[Exception] = []
+
+        def generate() -> None:
+            try:
+                if threads > 0:
+                    torch.set_num_threads(threads)
+                with torch.no_grad():
+                    model.generate(
+                        **inputs,
+                        generation_config=self.generation_config,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_CancelCriteria(cancel)]),
+                        adapter_names=None if adapter == DEFAULT_ADAPTER else [adapter],
+                    )
+            except Exception as e:
+                errors.append(e)
+                streamer.end()  # Unblock the consumer; generate never reached its own end().
+            finally:
+                self.adapters.release(adapter)
+
+        adapter = self.adapters.acquire(request.adapter)  # Released by generate
+        try:
+            threading.Thread(target=generate, name="lora-stream", daemon=True).start()
+        except BaseException:
+            self.adapters.release(adapter)
+            raise
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            cancel.set()
+        if errors:
+            raise errors[0]
@@ -0,0 +1,200 @@
+"""Pre-tokenized, memory-mapped token cache for LoRA training data.
+
+Tokenizing wikitext one example at a time on every rank at every launch is slow and
+keeps a Python object per token list. Instead the dataset is tokenized once, in
+batches, into a flat int32 token file plus an int64 offsets index:
+
+    <cache_dir>/<key>/tokens.bin   all examples' (unpadded, truncated) ids back to back
+    <cache_dir>/<key>/offsets.bin  example i is tokens[offsets[i]:offsets[i + 1]]
+    <cache_dir>/<key>/info.json    TokenCacheInfo, written last (marks the cache complete)
+
+`key` hashes the tokenizer, dataset and max_length, so changing any of them builds a
+new cache. Ranks map the files with np.memmap (copy-on-write, never written), so local
+ranks share the page cache instead of each holding a copy.
+
+Usage: python -m lora.token_cache  (prebuild for the default TrainingConfig)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import cast
+
+import numpy as np
+import torch.distributed as dist
+from datasets import load_dataset
+from pydantic import BaseModel
+from transformers import AutoTokenizer, PreTrainedTokenizerBase
+
+from lora.config import TrainingConfig
+
+INFO_FILE = "info.json"
+TOKENS_FILE = "tokens.bin"
+OFFSETS_FILE = "offsets.bin"
+_MAP_BATCH = 1000
+_ROWS_PER_PROC = 5000  # Below this, worker processes cost more than they save
+
+
+class TokenCacheInfo(BaseModel):
+    key: str
+    tokenizer: str
+    dataset_name: str
+    dataset_config: str
+    max_length: int
+    max_examples: int | None
+    num_examples: int
+    num_tokens: int
+    pad_token_id: int
+
+
+class TokenCache:
+    """Read-only view of a built cache; examples are int32 slices of one memmap."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.info = TokenCacheInfo.model_validate_json((path / INFO_FILE).read_text())
+        # Copy-on-write so torch.from_numpy can wrap it; pages are never written, so local
+        # ranks keep sharing them.
+        self.tokens = np.memmap(path / TOKENS_FILE, dtype=np.int32, mode="c")
+        self.offsets = np.memmap(path / OFFSETS_FILE, dtype=np.int64, mode="r")
+
+    def __len__(self) -> int:
+        return self.info.num_examples
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        return self.tokens[self.offsets[idx] : self.offsets[idx + 1]]
+
+
+def _non_empty(batch: dict[str, list[str]]) -> list[bool]:
+    return [bool(text.strip()) for text in batch["text"]]
+
+
+def cache_key(
+    tokenizer: PreTrainedTokenizerBase,
+    dataset_name: str,
+    dataset_config: str,
+    max_length: int,
+    max_examples: int | None,
+) -> str:
+    identity = {
+        "tokenizer": tokenizer.name_or_path,
+        "tokenizer_class": type(tokenizer).__name__,
+        "vocab_size": len(tokenizer),
+        "special_tokens": tokenizer.all_special_ids,
+        "dataset": f"{dataset_name}/{dataset_config}",
+        "max_length": max_length,
+        "max_examples": max_examples,
+    }
+    digest = hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+    return digest[:16]
+
+
+def build_token_cache(
+    tokenizer: PreTrainedTokenizerBase,
+    dataset_name: str,
+    dataset_config: str,
+    max_length: int,
+    cache_dir: Path,
+    max_examples: int | None = None,
+) -> Path:
+    """Batch-tokenize the train split into `cache_dir/<key>/`. Returns the cache path.
+
+    A no-op if the cache already exists. Files are written to a temp dir and renamed
+    into place, so readers never see a partial cache.
+    """
+    key = cache_key(tokenizer, dataset_name, dataset_config, max_length, max_examples)
+    path = cache_dir / key
+    if (path / INFO_FILE).is_file():
+        return path
+
+    raw = load_dataset(dataset_name, dataset_config, split="train")
+    raw = raw.filter(_non_empty, batched=True)
+    if max_examples is not None:
+        raw = raw.select(range(min(max_examples, len(raw))))
+    num_proc = min(os.cpu_count() or 1, len(raw) // _ROWS_PER_PROC) or None
+
+    def tokenize(batch: dict[str, list[str]]) -> dict[str, list[list[int]]]:
+        enc = tokenizer(batch["text"], truncation=True, max_length=max_length)
+        return {"input_ids": cast(list[list[int]], enc["input_ids"])}
+
+    encoded = raw.map(
+        tokenize,
+        batched=True,
+        batch_size=_MAP_BATCH,
+        num_proc=num_proc,
+        remove_columns=raw.column_names,
+    )
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=cache_dir, prefix=f".{key}-"))
+    lengths: list[int] = []
+    with (tmp / TOKENS_FILE).open("wb") as f:
+        for batch in encoded.iter(batch_size=_MAP_BATCH):
+            for ids in cast(dict[str, list[list[int]]], batch)["input_ids"]:
+                f.write(np.asarray(ids, dtype=np.int32).tobytes())
+                lengths.append(len(ids))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    offsets.tofile(tmp / OFFSETS_FILE)
+    pad = cast(int | None, tokenizer.pad_token_id)
+    if pad is None:
+        pad = cast(int | None, tokenizer.eos_token_id) or 0
+    info = TokenCacheInfo(
+        key=key,
+        tokenizer=tokenizer.name_or_path,
+        dataset_name=dataset_name,
+        dataset_config=dataset_config,
+        max_length=max_length,
+        max_examples=max_examples,
+        num_examples=len(lengths),
+        num_tokens=int(offsets[-1]),
+        pad_token_id=pad,
+    )
+    (tmp / INFO_FILE).write_text(info.model_dump_json(indent=2))
+    try:
+        tmp.rename(path)
+    except OSError:
+        shutil.rmtree(tmp)  # Another process finished the same cache first.
+    return path
+
+
+def load_token_cache(
+    config: TrainingConfig,
+    tokenizer: PreTrainedTokenizerBase,
+    local_rank: int = 0,
+) -> TokenCache:
+    """Open the cache for `config`, building it on local rank 0 while other ranks wait."""
+    cache_dir = config.data_dir / "token_cache"
+    if local_rank == 0:
+        build_token_cache(
+            tokenizer,
+            config.dataset_name,
+            config.dataset_config,
+            config.max_length,
+            cache_dir,
+            config.max_examples,
+        )
+    if dist.is_available() and dist.is_initialized():
+        dist.barrier()
+    key = cache_key(
+        tokenizer,
+        config.dataset_name,
+        config.dataset_config,
+        config.max_length,
+        config.max_examples,
+    )
+    return TokenCache(cache_dir / key)
+
+
+def main() -> None:
+    config = TrainingConfig()
+    tokenizer = AutoTokenizer.from_pretrained(config.model_name)
+    cache = load_token_cache(config, tokenizer)
+    print(f"Token cache {cache.path}: {len(cache)} examples, {cache.info.num_tokens} tokens")
+
+
+if __name__ == "__main__":
+    main()
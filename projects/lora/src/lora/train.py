@@ -2,23 +2,31 @@ import os
 import subprocess
 import sys
 import uuid
+from typing import cast
 
 import torch
+from common.checkpoint import Checkpointer
 from common.config import VertexConfig
+from common.dataloader import DevicePrefetcher, set_epoch
 from common.distributed import (
+    DeviceMean,
     DistributedConfig,
     cleanup_distributed,
     get_distributed_config,
+    grad_sync,
+    micro_steps,
     setup_distributed,
+    wrap_ddp,
 )
+from common.precision import MixedPrecision, resolve_precision
 from common.tracking import init_experiment, log_metrics, log_params, start_run
 from peft import LoraConfig, TaskType, get_peft_model
-from torch.nn.parallel import DistributedDataParallel as DDP
-from torch.utils.data import DistributedSampler
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
 from lora.config import LoRAConfig, TrainingConfig
 from lora.data import get_dataloader
+from lora.export import export_merged
+from lora.memory import fit_to_memory
 
 
 def run_training(
@@ -39,10 +47,14 @@ def run_training(
     )
 
     tokenizer = AutoTokenizer.from_pretrained(training_config.model_name)
-    model = AutoModelForCausalLM.from_pretrained(
-        training_config.model_name,
-        torch_dtype=torch.float32 if not torch.cuda.is_available() else torch.bfloat16,
-    )
+    amp = MixedPrecision(resolve_precision(training_config.precision, device), device)
+    model = AutoModelForCausalLM.from_pretrained(training_config.model_name, torch_dtype=amp.dtype)
+    vocab_size = cast(torch.nn.Embedding, model.get_input_embeddings()).num_embeddings
+    if training_config.gradient_checkpointing:
+        # Non-reentrant checkpointing works with frozen base weights (no input grads needed)
+        # and with DDP.
+        model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+        model.config.use_cache = False
     lora_cfg = lora_config or LoRAConfig(model_name=training_config.model_name)
     peft_config = LoraConfig(
         r=lora_cfg.r,
@@ -53,20 +65,25 @@ def run_training(
     )
     model = get_peft_model(model, peft_config)
     model = model.to(device)
-    model = DDP(model, device_ids=[device] if device.type == "cuda" else None)
+    training_config = fit_to_memory(model, training_config, amp, vocab_size, device, cfg.rank)
+    model = wrap_ddp(model, cfg, device)
 
     dataloader = get_dataloader(
         training_config,
         tokenizer,
         cfg.rank,
         cfg.world_size,
+        cfg.local_rank,
+        cfg.local_world_size,
     )
+    batches = DevicePrefetcher(dataloader, device, training_config.loader.prefetch_depth)
     optimizer = torch.optim.AdamW(model.parameters(), lr=training_config.lr)
 
     training_config.checkpoint_dir.mkdir(parents=True, exist_ok=True)
 
     run_id = ""
     checkpoint_dir = training_config.checkpoint_dir / "lora"
+    export_dir = training_config.checkpoint_dir / "lora_merged"
 
     if cfg.rank == 0 and vertex_config:
         init_experiment(
@@ -78,55 +95,77 @@ def run_training(
             {
                 "epochs": training_config.epochs,
                 "batch_size": training_config.batch_size,
+                "accumulation_steps": training_config.accumulation_steps,
+                "precision": amp.precision,
+                "gradient_checkpointing": training_config.gradient_checkpointing,
                 "lr": training_config.lr,
                 "model": lora_cfg.model_name,
             }
         )
 
-    for epoch in range(training_config.epochs):
-        sampler = dataloader.sampler
-        if isinstance(sampler, DistributedSampler):
-            sampler.set_epoch(epoch)
+    checkpointer = Checkpointer(
+        training_config.checkpoint_dir / "resume" / "lora",
+        training_config.checkpoint,
+        model.module,
+        optimizer,
+        amp.scaler,
+        cfg.rank,
+    )
+    position = checkpointer.restore()
+
+    for epoch in range(position.epoch, training_config.epochs):
+        set_epoch(dataloader, epoch, checkpointer.begin_epoch(epoch))
         model.train()
-        total_loss = 0.0
-        for batch in dataloader:
-            input_ids = batch.input_ids.to(device)
-            attention_mask = batch.attention_mask.to(device)
-            labels = batch.labels.to(device)
+        epoch_loss = DeviceMean(device)
+        interval_loss = DeviceMean(device)
+        schedule = micro_steps(len(batches), training_config.accumulation_steps)
+        num_steps = sum(micro.sync for micro in schedule)
+        step = 0
+        optimizer.zero_grad()
+        for i, (batch, micro) in enumerate(zip(batches, schedule, strict=True), 1):
+            with grad_sync(model, micro.sync):
+                with amp.autocast():
+                    outputs = model(**batch.model_inputs(device))
+                loss = outputs.loss
+                amp.backward(loss * micro.scale)
+            epoch_loss.add(loss)
+            interval_loss.add(loss)
+            if not micro.sync:
+                continue
+            amp.step(optimizer)
             optimizer.zero_grad()
-            outputs = model(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                labels=labels,
-            )
-            loss = outputs.loss
-            loss.backward()
-            optimizer.step()
-            total_loss += loss.item()
-        avg_loss = total_loss / len(dataloader)
+            step += 1
+            checkpointer.step(i)
+            if training_config.log_interval and step % training_config.log_interval == 0:
+                if cfg.rank == 0:
+                    print(f"  step {step}/{num_steps} loss={interval_loss.local_mean():.4f}")
+                interval_loss.reset()
+        avg_loss = epoch_loss.global_mean()  # Collective: the mean over every rank's steps
+        checkpointer.end_epoch()
         if cfg.rank == 0:
             print(f"Epoch {epoch + 1}/{training_config.epochs} loss={avg_loss:.4f}")
             if vertex_config:
                 log_metrics({"loss": avg_loss})
 
+    checkpointer.close()
     if cfg.rank == 0:
         checkpoint_dir.mkdir(parents=True, exist_ok=True)
         peft_model = model.module
         peft_model.save_pretrained(checkpoint_dir)
+        if training_config.export != "none":
+            quantize = "int8" if training_config.export == "int8" else "none"
+            export_merged(peft_model, export_dir, training_config.model_name, quantize)
+    checkpointer.finish()  # Final model written; a rerun must not resume this run
 
     is_master = cfg.rank == 0
     cleanup_distributed()
 
     if is_master and vertex_config:
+        upload_args = [str(checkpoint_dir.absolute()), run_id, "lora"]
+        if training_config.export != "none":
+            upload_args.append(str(export_dir.absolute()))
         subprocess.Popen(
-            [
-                sys.executable,
-                "-m",
-                "common.upload_standalone",
-                str(checkpoint_dir.absolute()),
-                run_id,
-                "lora",
-            ],
+            [sys.executable, "-m", "common.upload_standalone", *upload_args],
             start_new_session=True,
             cwd=os.getcwd(),
             env=os.environ.copy(),
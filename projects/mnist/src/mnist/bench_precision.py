@@ -0,0 +1,95 @@
+"""Compare training precisions on MNIST: samples/sec and test accuracy per mode.
+
+Each mode trains a freshly seeded MnistCNN for the same number of steps on the same
+batches (one process, no DDP), then evaluates the full test set under the same autocast.
+On CPU, bf16 is only fast on chips with native bf16 matmul (AVX512-BF16 / AMX).
+
+Usage: python -m mnist.bench_precision [--steps 300] [--batch-size 64] [--data-dir ./data]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from common.config import Precision
+from common.dataloader import DevicePrefetcher
+from common.precision import MixedPrecision
+from pydantic import BaseModel
+
+from mnist.config import TrainingConfig
+from mnist.data import get_dataloader, get_test_dataloader
+from mnist.model import MnistCNN
+from mnist.train import evaluate
+
+MODES: list[Precision] = ["fp32", "bf16", "fp16"]
+
+
+class BenchResult(BaseModel):
+    precision: str
+    samples_per_s: float
+    train_loss: float
+    test_accuracy: float
+
+
+def bench(config: TrainingConfig, steps: int, device: torch.device) -> BenchResult:
+    torch.manual_seed(0)
+    model = MnistCNN().to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=config.lr)
+    loss_fn = nn.CrossEntropyLoss()
+    amp = MixedPrecision(config.precision, device)
+    loader = get_dataloader(config, rank=0, world_size=1)
+    batches = [(x.to(device), y.to(device)) for x, y in loader][: steps + 1]
+
+    model.train()
+    loss = torch.zeros((), device=device)
+    start = 0.0
+    for step, (data, target) in enumerate(batches):  # Step 0 warms up and is not timed
+        if step == 1:
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+        optimizer.zero_grad()
+        with amp.autocast():
+            loss = loss_fn(model(data), target)
+        amp.backward(loss)
+        amp.step(optimizer)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+
+    test_batches = DevicePrefetcher(get_test_dataloader(config), device)
+    _, accuracy = evaluate(model, test_batches, loss_fn, device, amp)
+    samples = sum(len(target) for _, target in batches[1:])
+    return BenchResult(
+        precision=config.precision,
+        samples_per_s=samples / elapsed if elapsed else 0.0,
+        train_loss=loss.item(),
+        test_accuracy=accuracy,
+    )
+
+
+def main() -> None:
+    defaults = TrainingConfig()
+    parser = argparse.ArgumentParser(description="Benchmark MNIST training precisions")
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+    parser.add_argument("--data-dir", type=Path, default=defaults.data_dir)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"{'precision':>9} {'samples/s':>10} {'train loss':>11} {'test acc':>9}")
+    for mode in MODES:
+        config = defaults.model_copy(
+            update={"batch_size": args.batch_size, "data_dir": args.data_dir, "precision": mode}
+        )
+        r = bench(config, args.steps, device)
+        print(
+            f"{r.precision:>9} {r.samples_per_s:>10.1f} {r.train_loss:>11.4f}"
+            f" {r.test_accuracy:>9.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
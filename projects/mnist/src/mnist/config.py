@@ -1,5 +1,6 @@
 from pathlib import Path
 
+from common.config import CheckpointConfig, DataLoaderConfig, Precision
 from pydantic import BaseModel
 
 
@@ -9,3 +10,12 @@ class TrainingConfig(BaseModel):
     lr: float = 0.001
     data_dir: Path = Path("./data")
     checkpoint_dir: Path = Path("./checkpoints")
+    in_memory: bool = True  # Whole dataset as tensors with batched gathers (vs torchvision)
+    loader: DataLoaderConfig = DataLoaderConfig()
+    checkpoint: CheckpointConfig = CheckpointConfig()
+    precision: Precision = "fp32"  # Autocast mode; see common.config.Precision
+    # Micro-batches per optimizer step; gradients are all-reduced once per step, so the
+    # effective batch is batch_size * accumulation_steps * world_size.
+    accumulation_steps: int = 1
+    log_interval: int = 100  # Optimizer steps between rank-0 loss prints; 0 logs epochs only
+    eval_every: int = 0  # Epochs between test-set evaluations; 0 evaluates after the last only
@@ -1,18 +1,52 @@
-import os
+from typing import cast
 
-from common.dataloader import create_distributed_dataloader
+import torch
+from common.dataloader import create_distributed_dataloader, create_sharded_dataloader
 from torch import Tensor
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Dataset
 from torchvision import datasets, transforms
 
 from mnist.config import TrainingConfig
 
+MEAN = 0.1307
+STD = 0.3081
+
+
+class InMemoryMNIST(Dataset[tuple[Tensor, Tensor]]):
+    """All of MNIST as one uint8 tensor (~47 MB for train), normalized per batch.
+
+    DataLoader fetches a whole batch through `__getitems__`: one index gather plus one
+    vectorized normalization, instead of a PIL/ToTensor/Normalize pass per sample.
+    Output matches ToTensor() + Normalize((MEAN,), (STD,)).
+    """
+
+    def __init__(self, images: Tensor, targets: Tensor) -> None:
+        self.images = images
+        self.targets = targets
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def __getitem__(self, idx: int) -> tuple[Tensor, Tensor]:
+        images, targets = self.__getitems__([idx])
+        return images[0], targets[0]
+
+    def __getitems__(self, indices: list[int]) -> tuple[Tensor, Tensor]:
+        idx = torch.tensor(indices)
+        images = self.images[idx].unsqueeze(1).float()
+        return images.mul_(1.0 / (255.0 * STD)).sub_(MEAN / STD), self.targets[idx]
+
+
+def collate_batch(batch: object) -> tuple[Tensor, Tensor]:
+    """InMemoryMNIST.__getitems__ already returns a collated (images, targets) batch."""
+    return cast(tuple[Tensor, Tensor], batch)
+
 
 def get_dataset(config: TrainingConfig, train: bool = True) -> datasets.MNIST:
     transform = transforms.Compose(
         [
             transforms.ToTensor(),
-            transforms.Normalize((0.1307,), (0.3081,)),
+            transforms.Normalize((MEAN,), (STD,)),
         ]
     )
     config.data_dir.mkdir(parents=True, exist_ok=True)
@@ -24,26 +58,64 @@ def get_dataset(config: TrainingConfig, train: bool = True) -> datasets.MNIST:
     )
 
 
+def get_in_memory_dataset(config: TrainingConfig, train: bool = True) -> InMemoryMNIST:
+    """Download if needed, then keep the raw IDX images and labels as tensors."""
+    mnist = get_dataset(config, train=train)
+    return InMemoryMNIST(mnist.data, mnist.targets)
+
+
 def get_dataloader(
     config: TrainingConfig,
     rank: int,
     world_size: int,
+    local_world_size: int = 1,
 ) -> DataLoader[tuple[Tensor, Tensor]]:
+    pin_memory = config.loader.resolved_pin_memory()
+    if config.in_memory:
+        # Batches are a tensor gather: a worker process would only add IPC.
+        return create_distributed_dataloader(
+            get_in_memory_dataset(config, train=True),
+            batch_size=config.batch_size,
+            rank=rank,
+            world_size=world_size,
+            collate_fn=collate_batch,
+            num_workers=0,
+            pin_memory=pin_memory,
+        )
     dataset = get_dataset(config, train=True)
-    num_workers = 1 if (os.cpu_count() or 1) >= 2 else 0
     return create_distributed_dataloader(
         dataset,
         batch_size=config.batch_size,
         rank=rank,
         world_size=world_size,
-        num_workers=num_workers,
+        num_workers=config.loader.resolved_num_workers(local_world_size),
+        pin_memory=pin_memory,
+        prefetch_factor=config.loader.prefetch_factor,
     )
 
 
-def get_test_dataloader(config: TrainingConfig) -> DataLoader[tuple[Tensor, Tensor]]:
-    dataset = get_dataset(config, train=False)
-    return DataLoader(
-        dataset,
+def get_test_dataloader(
+    config: TrainingConfig,
+    rank: int = 0,
+    world_size: int = 1,
+    local_world_size: int = 1,
+) -> DataLoader[tuple[Tensor, Tensor]]:
+    """This rank's shard of the test set; every test image is on exactly one rank."""
+    pin_memory = config.loader.resolved_pin_memory()
+    if config.in_memory:
+        return create_sharded_dataloader(
+            get_in_memory_dataset(config, train=False),
+            batch_size=config.batch_size,
+            rank=rank,
+            world_size=world_size,
+            collate_fn=collate_batch,
+            pin_memory=pin_memory,
+        )
+    return create_sharded_dataloader(
+        get_dataset(config, train=False),
         batch_size=config.batch_size,
-        shuffle=False,
+        rank=rank,
+        world_size=world_size,
+        num_workers=config.loader.resolved_num_workers(local_world_size),
+        pin_memory=pin_memory,
     )
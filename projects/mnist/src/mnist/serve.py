@@ -1,19 +1,35 @@
 """MnistCase implements CaseProtocol for the reusable serve app."""
 
+import ast
+import struct
+import sys
+import warnings
+from collections.abc import Sequence
+
 import torch
-from common.serve_base import download_from_gcs
+from common.artifact_cache import artifact_path
 from common.serve_models import PredictRequest, PredictResponse
+from common.weights import load_module
+from pydantic import Field
 
 from mnist.model import MnistCNN
 
 MEAN = 0.1307
 STD = 0.3081
+PIXELS = 28 * 28
+
+# Binary bodies: raw little-endian pixels, or an .npy file. float32 pixels are in [0, 1]
+# like the JSON `image` field; uint8 pixels are 0-255. Either may hold N images.
+RAW_CONTENT_TYPE = "application/octet-stream"  # "; dtype=uint8" selects uint8 (default float32)
+NPY_CONTENT_TYPE = "application/x-npy"
+_DTYPES = {"float32": torch.float32, "uint8": torch.uint8}
+_NPY_DTYPES = {"<f4": torch.float32, "|u1": torch.uint8, "<u1": torch.uint8}
 
 
 class MnistPredictRequest(PredictRequest):
     """Request: flattened 28x28 image as list of floats."""
 
-    image: list[float] = []
+    image: list[float] = Field(min_length=PIXELS, max_length=PIXELS)
 
 
 class MnistPredictResponse(PredictResponse):
@@ -23,25 +39,114 @@ class MnistPredictResponse(PredictResponse):
     probabilities: list[float]
 
 
+class MnistBatchPredictResponse(PredictResponse):
+    """Response to a binary request: one prediction per image, in order."""
+
+    predictions: list[MnistPredictResponse]
+
+
+def _parse_content_type(content_type: str) -> tuple[str, dict[str, str]]:
+    media, *params = (part.strip() for part in content_type.split(";"))
+    options = dict(p.split("=", 1) for p in params if "=" in p)
+    return media.lower(), {k.strip().lower(): v.strip() for k, v in options.items()}
+
+
+def _npy_payload(body: bytes) -> tuple[torch.dtype, int]:
+    """Dtype and data offset of an .npy body; the array data itself is not copied."""
+    if body[:6] != b"\x93NUMPY":
+        raise ValueError("Not an .npy payload")
+    version_1 = body[6:7] == b"\x01"  # v1 has a 2-byte header length, later versions 4
+    start = 10 if version_1 else 12
+    if len(body) < start:
+        raise ValueError("Malformed .npy header")
+    try:
+        (header_len,) = struct.unpack("<H" if version_1 else "<I", body[8:start])
+        if start + header_len > len(body):
+            raise ValueError("header runs past the end of the body")
+        header = ast.literal_eval(body[start : start + header_len].decode("latin1"))
+    except (struct.error, SyntaxError, ValueError, RecursionError) as e:
+        raise ValueError("Malformed .npy header") from e
+    if not isinstance(header, dict) or header.get("fortran_order"):
+        raise ValueError("Only C-ordered .npy arrays are supported")
+    dtype = _NPY_DTYPES.get(str(header.get("descr")))
+    if dtype is None:
+        raise ValueError(f"Unsupported .npy dtype {header.get('descr')}; use <f4 or |u1")
+    return dtype, start + header_len
+
+
+def decode_images(body: bytes, content_type: str) -> torch.Tensor:
+    """Decode a binary body into a normalized (N, 1, 28, 28) float tensor.
+
+    The pixel data is viewed in place with torch.frombuffer; the only copy is the
+    float conversion/normalization. Raises ValueError on malformed payloads.
+    """
+    media, options = _parse_content_type(content_type)
+    if media == NPY_CONTENT_TYPE:
+        dtype, offset = _npy_payload(body)
+    elif media == RAW_CONTENT_TYPE:
+        dtype = _DTYPES.get(options.get("dtype", "float32"))
+        if dtype is None:
+            raise ValueError(f"Unsupported dtype {options['dtype']}; use float32 or uint8")
+        offset = 0
+    else:
+        raise ValueError(f"Unsupported content type: {media}")
+    if dtype != torch.uint8 and sys.byteorder != "little":
+        raise ValueError("float32 payloads require a little-endian host")
+    itemsize = torch.empty((), dtype=dtype).element_size()
+    count = (len(body) - offset) // itemsize
+    if count == 0 or count % PIXELS or (len(body) - offset) % itemsize:
+        raise ValueError(f"Payload must hold N x {PIXELS} pixels")
+    with warnings.catch_warnings():
+        # frombuffer warns on read-only buffers (request bodies are bytes); the view is only read.
+        warnings.filterwarnings("ignore", "The given buffer is not writable", UserWarning)
+        pixels = torch.frombuffer(body, dtype=dtype, count=count, offset=offset)
+    images = pixels.view(-1, 1, 28, 28)
+    if dtype == torch.uint8:
+        return images.float().mul_(1.0 / (255.0 * STD)).sub_(MEAN / STD)
+    return images.sub(MEAN).div_(STD)
+
+
 class MnistCase:
     RequestModel = MnistPredictRequest
     ResponseModel = MnistPredictResponse
 
     def load(self, path: str) -> MnistCNN:
-        local = path
-        if path.startswith("gs://"):
-            local = download_from_gcs(path, "/tmp/model.pt")
-        model = MnistCNN()
-        model.load_state_dict(torch.load(local, map_location="cpu", weights_only=True))
+        """Map the weights (.safetensors, or a legacy .pt) rather than copying them in."""
+        with torch.device("meta"):
+            model = MnistCNN()
+        with artifact_path(path) as local:
+            load_module(model, local)
         model.eval()
         return model
 
+    def warmup(self, model: MnistCNN) -> None:
+        self.predict(model, MnistPredictRequest(image=[0.0] * PIXELS))
+
     def predict(self, model: MnistCNN, request: MnistPredictRequest) -> MnistPredictResponse:
-        tensor = torch.tensor([request.image], dtype=torch.float32)
+        return self.predict_batch(model, [request])[0]
+
+    def predict_batch(
+        self, model: MnistCNN, requests: Sequence[MnistPredictRequest]
+    ) -> list[MnistPredictResponse]:
+        """Stack all images into one (N, 1, 28, 28) tensor and run a single forward."""
+        tensor = torch.tensor([r.image for r in requests], dtype=torch.float32)
         tensor = tensor.view(-1, 1, 28, 28)
-        tensor = (tensor - MEAN) / STD
+        return self._predict_tensor(model, (tensor - MEAN) / STD)
+
+    def predict_bytes(
+        self, model: MnistCNN, body: bytes, content_type: str
+    ) -> MnistBatchPredictResponse:
+        """Predict every image in a raw float32/uint8 or .npy body (see decode_images)."""
+        return MnistBatchPredictResponse(
+            predictions=self._predict_tensor(model, decode_images(body, content_type))
+        )
+
+    def _predict_tensor(self, model: MnistCNN, images: torch.Tensor) -> list[MnistPredictResponse]:
         with torch.no_grad():
-            logits = model(tensor)
-        probs = torch.softmax(logits, dim=1)[0].tolist()
-        pred = int(torch.argmax(logits, dim=1)[0].item())
-        return MnistPredictResponse(prediction=pred, probabilities=probs)
+            logits = model(images)
+        probs = torch.softmax(logits, dim=1).tolist()
+        preds = torch.argmax(logits, dim=1).tolist()
+        return [
+            MnistPredictResponse(prediction=int(pred), probabilities=p)
+            for pred, p in zip(preds, probs, strict=True)
+        ]
@@ -1,22 +1,31 @@
 import os
 import subprocess
 import sys
+import time
 import uuid
 from pathlib import Path
 from typing import cast
 
 import torch
 import torch.nn as nn
+from common.checkpoint import Checkpointer
 from common.config import VertexConfig
+from common.dataloader import DevicePrefetcher, set_epoch
 from common.distributed import (
+    DeviceMean,
     DistributedConfig,
+    all_reduce_sum,
     cleanup_distributed,
     get_distributed_config,
+    grad_sync,
+    micro_steps,
     setup_distributed,
+    wrap_ddp,
 )
+from common.precision import MixedPrecision
 from common.tracking import init_experiment, log_metrics, log_params, start_run
+from common.weights import save_weights
 from torch.nn.parallel import DistributedDataParallel as DDP
-from torch.utils.data import DistributedSampler
 
 from mnist.config import TrainingConfig
 from mnist.data import get_dataloader, get_test_dataloader
@@ -25,46 +34,71 @@ from mnist.model import MnistCNN
 
 def train_one_epoch(
     model: DDP,
-    dataloader: torch.utils.data.DataLoader[tuple[torch.Tensor, torch.Tensor]],
+    dataloader: DevicePrefetcher[tuple[torch.Tensor, torch.Tensor]],
     optimizer: torch.optim.Optimizer,
     loss_fn: nn.Module,
     device: torch.device,
     rank: int,
+    amp: MixedPrecision,
+    log_interval: int = 0,
+    accumulation_steps: int = 1,
+    checkpointer: Checkpointer | None = None,
 ) -> float:
+    """Train one epoch; returns the mean loss over all ranks (every rank must call it)."""
     model.train()
-    total_loss = 0.0
-    for _batch_idx, (data, target) in enumerate(dataloader):
-        data, target = data.to(device), target.to(device)
+    epoch_loss = DeviceMean(device)
+    interval_loss = DeviceMean(device)
+    schedule = micro_steps(len(dataloader), accumulation_steps)
+    num_steps = sum(micro.sync for micro in schedule)
+    step = 0
+    optimizer.zero_grad()
+    for batch, ((data, target), micro) in enumerate(zip(dataloader, schedule, strict=True), 1):
+        with grad_sync(model, micro.sync):
+            with amp.autocast():
+                output = model(data)
+                loss = loss_fn(output, target)
+            amp.backward(loss * micro.scale)
+        epoch_loss.add(loss)
+        interval_loss.add(loss)
+        if not micro.sync:
+            continue
+        amp.step(optimizer)
         optimizer.zero_grad()
-        output = model(data)
-        loss = loss_fn(output, target)
-        loss.backward()
-        optimizer.step()
-        total_loss += loss.item()
-    return total_loss / len(dataloader)
+        step += 1
+        if checkpointer is not None:
+            checkpointer.step(batch)
+        if log_interval and step % log_interval == 0:
+            if rank == 0:
+                print(f"  step {step}/{num_steps} loss={interval_loss.local_mean():.4f}")
+            interval_loss.reset()
+    return epoch_loss.global_mean()
 
 
 def evaluate(
-    model: DDP,
-    dataloader: torch.utils.data.DataLoader[tuple[torch.Tensor, torch.Tensor]],
+    model: nn.Module,
+    dataloader: DevicePrefetcher[tuple[torch.Tensor, torch.Tensor]],
     loss_fn: nn.Module,
     device: torch.device,
+    amp: MixedPrecision,
 ) -> tuple[float, float]:
+    """Loss and accuracy over every rank's test shard (every rank must call it).
+
+    Pass the unwrapped module: shards can differ by a batch, so the forward pass must
+    not involve DDP collectives.
+    """
     model.eval()
-    total_loss = 0.0
-    correct = 0
-    total = 0
+    sums = torch.zeros(3, dtype=torch.float64, device=device)  # loss, correct, total
     with torch.no_grad():
         for data, target in dataloader:
-            data, target = data.to(device), target.to(device)
-            output = model(data)
-            total_loss += loss_fn(output, target).item()
-            pred = output.argmax(dim=1)
-            correct += (pred == target).sum().item()
-            total += target.size(0)
-    test_loss = total_loss / len(dataloader)
-    test_accuracy = correct / total
-    return test_loss, test_accuracy
+            with amp.autocast():
+                output = model(data)
+            sums[0] += loss_fn(output, target) * target.size(0)
+            sums[1] += (output.argmax(dim=1) == target).sum()
+            sums[2] += target.size(0)
+    loss_sum, correct, total = all_reduce_sum(sums).tolist()
+    if not total:
+        return 0.0, 0.0
+    return loss_sum / total, correct / total
 
 
 def run_training(
@@ -83,20 +117,28 @@ def run_training(
         torch.device(f"cuda:{cfg.local_rank}") if torch.cuda.is_available() else torch.device("cpu")
     )
     model = MnistCNN().to(device)
-    model = DDP(model, device_ids=[device] if device.type == "cuda" else None)
+    model = wrap_ddp(model, cfg, device)
 
     dataloader = get_dataloader(
         training_config,
         cfg.rank,
         cfg.world_size,
+        cfg.local_world_size,
     )
+    depth = training_config.loader.prefetch_depth
+    batches = DevicePrefetcher(dataloader, device, depth)
+    test_loader = get_test_dataloader(
+        training_config, cfg.rank, cfg.world_size, cfg.local_world_size
+    )
+    test_batches = DevicePrefetcher(test_loader, device, depth)
     optimizer = torch.optim.Adam(model.parameters(), lr=training_config.lr)
     loss_fn = nn.CrossEntropyLoss()
+    amp = MixedPrecision(training_config.precision, device)
 
     training_config.checkpoint_dir.mkdir(parents=True, exist_ok=True)
 
     run_id = ""
-    checkpoint_path: Path = training_config.checkpoint_dir / "model.pt"
+    checkpoint_path: Path = training_config.checkpoint_dir / "model.safetensors"
 
     if cfg.rank == 0 and vertex_config:
         init_experiment(vertex_config)
@@ -106,28 +148,60 @@ def run_training(
             {
                 "epochs": training_config.epochs,
                 "batch_size": training_config.batch_size,
+                "accumulation_steps": training_config.accumulation_steps,
+                "precision": training_config.precision,
                 "lr": training_config.lr,
             }
         )
 
-    for epoch in range(training_config.epochs):
-        sampler = dataloader.sampler
-        if isinstance(sampler, DistributedSampler):
-            sampler.set_epoch(epoch)
-        avg_loss = train_one_epoch(model, dataloader, optimizer, loss_fn, device, cfg.rank)
+    checkpointer = Checkpointer(
+        training_config.checkpoint_dir / "resume" / "mnist",
+        training_config.checkpoint,
+        model.module,
+        optimizer,
+        amp.scaler,
+        cfg.rank,
+    )
+    position = checkpointer.restore()
+
+    for epoch in range(position.epoch, training_config.epochs):
+        set_epoch(dataloader, epoch, checkpointer.begin_epoch(epoch))
+        start = time.perf_counter()
+        avg_loss = train_one_epoch(
+            model,
+            batches,
+            optimizer,
+            loss_fn,
+            device,
+            cfg.rank,
+            amp,
+            training_config.log_interval,
+            training_config.accumulation_steps,
+            checkpointer,
+        )
+        checkpointer.end_epoch()
+        samples_per_s = len(dataloader) * training_config.batch_size / (time.perf_counter() - start)
         if cfg.rank == 0:
-            print(f"Epoch {epoch + 1}/{training_config.epochs} loss={avg_loss:.4f}")
+            print(
+                f"Epoch {epoch + 1}/{training_config.epochs} loss={avg_loss:.4f}"
+                f" ({samples_per_s:.0f} samples/s per rank)"
+            )
             if vertex_config:
                 log_metrics({"loss": avg_loss})
 
+        last = epoch + 1 == training_config.epochs
+        every = training_config.eval_every
+        if last or (every and (epoch + 1) % every == 0):
+            test_loss, test_accuracy = evaluate(model.module, test_batches, loss_fn, device, amp)
+            if cfg.rank == 0:
+                print(f"Test loss={test_loss:.4f} accuracy={test_accuracy:.4f}")
+                if vertex_config:
+                    log_metrics({"test_loss": test_loss, "test_accuracy": test_accuracy})
+
+    checkpointer.close()
     if cfg.rank == 0:
-        checkpoint_path = training_config.checkpoint_dir / "model.pt"
-        torch.save(cast(MnistCNN, model.module).state_dict(), checkpoint_path)
-        test_dataloader = get_test_dataloader(training_config)
-        test_loss, test_accuracy = evaluate(model, test_dataloader, loss_fn, device)
-        print(f"Test loss={test_loss:.4f} accuracy={test_accuracy:.4f}")
-        if vertex_config:
-            log_metrics({"test_loss": test_loss, "test_accuracy": test_accuracy})
+        save_weights(cast(MnistCNN, model.module).state_dict(), checkpoint_path)
+    checkpointer.finish()  # Final model written; a rerun must not resume this run
 
     is_master = cfg.rank == 0
     cleanup_distributed()
@@ -1,20 +1,46 @@
 """Reusable FastAPI app that delegates to case (mnist, lora) via MODEL_CASE env."""
 
+import asyncio
 import os
-from typing import cast
+import threading
+from collections.abc import AsyncGenerator, Callable, Iterator
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, TypeVar, cast
 
-from common.serve_base import CaseProtocol
-from common.serve_models import PredictRequestBody, PredictResponse
-from fastapi import FastAPI
-from pydantic import BaseModel
+from common.artifact_cache import fetch_artifact
+from common.serve_base import (
+    BinaryCaseProtocol,
+    CaseProtocol,
+    StreamingCaseProtocol,
+    TokenGenerationCaseProtocol,
+)
+from common.serve_models import PredictStreamChunk, PreparedGeneration
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 
-app = FastAPI()
+from serve.batching import BatchingConfig, BatchingMetrics, MicroBatcher, QueueFullError
+
+if TYPE_CHECKING:
+    from serve.scheduler import ContinuousBatchScheduler, GenerationHandle
+
+T = TypeVar("T")
 
 MODEL_CASE = os.environ.get("MODEL_CASE", "mnist")
-MODEL_PATH = os.environ.get("MODEL_PATH", "./checkpoints/model.pt")
+MODEL_PATH = os.environ.get("MODEL_PATH", "./checkpoints/model.safetensors")
+# Load + warm up the model at startup; /health reports 503 until it finishes.
+SERVE_WARMUP = os.environ.get("SERVE_WARMUP", "0").lower() in ("1", "true", "yes")
+# Step-level scheduler with a KV-cache pool instead of run-to-completion batches (lora).
+CONTINUOUS_BATCHING = os.environ.get("CONTINUOUS_BATCHING", "0").lower() in ("1", "true", "yes")
+# Comma-separated gs:// URIs (e.g. adapters) pulled into the artifact cache at startup.
+ARTIFACT_PREFETCH = [uri for uri in os.environ.get("ARTIFACT_PREFETCH", "").split(",") if uri]
 
 _case: CaseProtocol[object] | None = None
 _model: object | None = None
+_model_lock = threading.Lock()
+_ready = threading.Event()
+_warmup_error: str | None = None
 
 
 def _get_case() -> CaseProtocol[object]:
@@ -41,27 +67,285 @@ def _load_model() -> object:
     global _model
     if _model is not None:
         return _model
-    case = _get_case()
-    _model = case.load(MODEL_PATH)
+    with _model_lock:
+        if _model is None:
+            case = _get_case()
+            _model = case.load(MODEL_PATH)
     return _model
 
 
+def preload() -> object:
+    """Load the model now, without warming it up (serve.workers, before it forks)."""
+    return _load_model()
+
+
+def _warmup() -> None:
+    """Load the model and run one dummy prediction, then mark the app ready."""
+    global _warmup_error
+    try:
+        _get_case().warmup(_load_model())
+    except Exception as e:
+        _warmup_error = f"{type(e).__name__}: {e}"
+        return
+    _ready.set()
+
+
+def _prefetch() -> None:
+    """Fetch ARTIFACT_PREFETCH into the artifact cache so later loads find it on disk."""
+    for uri in ARTIFACT_PREFETCH:
+        try:
+            fetch_artifact(uri)
+        except Exception as e:
+            print(f"Prefetch of {uri} failed: {type(e).__name__}: {e}")
+
+
+@asynccontextmanager
+async def _lifespan(_app: FastAPI) -> AsyncGenerator[None, None]:
+    if ARTIFACT_PREFETCH:
+        threading.Thread(target=_prefetch, name="prefetch", daemon=True).start()
+    if SERVE_WARMUP:
+        # Background thread so the port opens immediately and /health can report progress.
+        threading.Thread(target=_warmup, name="warmup", daemon=True).start()
+    else:
+        _ready.set()
+    yield
+
+
+app = FastAPI(lifespan=_lifespan)
+
+
 _case_for_route = _get_case()
+_batching_config = BatchingConfig.from_env()
+_batcher = MicroBatcher(_case_for_route, _load_model, _batching_config)
+# Threaded /predict/stream generations share the cores like the batcher's inference workers.
+_stream_slots = threading.BoundedSemaphore(_batching_config.workers)
+
+
+def _build_scheduler(case: CaseProtocol[object]) -> "ContinuousBatchScheduler | None":
+    """Continuous batching for generative cases, opt-in via CONTINUOUS_BATCHING=1."""
+    if not CONTINUOUS_BATCHING:
+        return None
+    if not isinstance(case, TokenGenerationCaseProtocol):
+        raise ValueError(f"Case {MODEL_CASE} does not support CONTINUOUS_BATCHING")
+    token_case = case
+    from serve.scheduler import ContinuousBatchScheduler, SchedulerConfig
+
+    return ContinuousBatchScheduler(
+        _load_model,
+        token_case.eos_token_id,
+        SchedulerConfig.from_env(),
+    )
+
+
+_scheduler = _build_scheduler(_case_for_route)
+
+
+async def _predict_scheduled(
+    scheduler: "ContinuousBatchScheduler",
+    case: TokenGenerationCaseProtocol,
+    prepared: PreparedGeneration,
+) -> BaseModel:
+    handle = _submit_scheduled(scheduler, case, prepared)
+    try:
+        tokens = await asyncio.wrap_future(handle.result)
+    finally:
+        handle.cancel()  # No-op when finished; frees the slot if the client went away.
+    return case.to_response(case.decode(tokens))
+
+
+def _request_openapi(case: CaseProtocol[object], binary: bool = False) -> dict[str, object]:
+    """Document the request body, since the predict routes read and validate raw bytes."""
+    content: dict[str, object] = {
+        "application/json": {"schema": case.RequestModel.model_json_schema()}
+    }
+    if binary and isinstance(case, BinaryCaseProtocol):
+        content["application/octet-stream"] = {"schema": {"type": "string", "format": "binary"}}
+    return {"requestBody": {"required": True, "content": content}}
+
+
+def _parse_request(body: bytes) -> BaseModel:
+    """Parse and validate a JSON body straight into the case's RequestModel, once."""
+    try:
+        return _case_for_route.RequestModel.model_validate_json(body)
+    except ValidationError as e:
+        errors = [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        raise RequestValidationError(errors, body=body) from e
+
 
+def _json_response(response: BaseModel) -> Response:
+    """Serialize with pydantic directly; the case already built a valid ResponseModel."""
+    return Response(content=response.model_dump_json(), media_type="application/json")
 
-@app.post("/predict", response_model=_case_for_route.ResponseModel)  # type: ignore[reportUntypedFunctionDecorator]
-def predict(request: PredictRequestBody) -> PredictResponse:
-    """Predict: FastAPI parses body, case validates via RequestModel."""
-    req = _case_for_route.RequestModel.model_validate(request.model_dump())
-    model = _load_model()
-    return cast(PredictResponse, _case_for_route.predict(model, req))
+
+def _admit(submit: Callable[[], T]) -> T:
+    """Queue work on the inference workers, shedding load with 503 when the queue is full."""
+    try:
+        return submit()
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"}) from e
+
+
+def _submit_scheduled(
+    scheduler: "ContinuousBatchScheduler",
+    case: TokenGenerationCaseProtocol,
+    prepared: PreparedGeneration,
+) -> "GenerationHandle":
+    """Queue a prepared generation (503 when full); `prepared` is released once it ends."""
+    try:
+        handle = _admit(lambda: scheduler.submit(prepared))
+    except HTTPException:
+        case.release(prepared)
+        raise
+    handle.result.add_done_callback(lambda _: case.release(prepared))
+    return handle
+
+
+def _acquire_stream_slot() -> None:
+    if not _stream_slots.acquire(blocking=False):
+        raise QueueFullError(f"{_batching_config.workers} streams already generating")
+
+
+async def _predict_binary(body: bytes, content_type: str) -> BaseModel:
+    """Non-JSON body: the case decodes it (possibly a whole batch) in one call."""
+    case = _case_for_route
+    if not isinstance(case, BinaryCaseProtocol):
+        raise HTTPException(status_code=415, detail=f"Case {MODEL_CASE} accepts JSON only")
+    binary_case = case
+    future = _admit(
+        lambda: _batcher.run(lambda: binary_case.predict_bytes(_load_model(), body, content_type))
+    )
+    try:
+        return await asyncio.wrap_future(future)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@app.post(
+    "/predict",
+    response_model=None,
+    responses={200: {"model": _case_for_route.ResponseModel}},
+    openapi_extra=_request_openapi(_case_for_route, binary=True),
+)  # type: ignore[reportUntypedFunctionDecorator]
+async def predict(http_request: Request) -> Response:
+    """Predict: JSON bodies are validated once into RequestModel and coalesced by the batcher;
+    other content types go straight to the case's predict_bytes."""
+    body = await http_request.body()
+    content_type = http_request.headers.get("content-type", "application/json")
+    if content_type.split(";")[0].strip().lower() != "application/json":
+        return _json_response(await _predict_binary(body, content_type))
+    req = _parse_request(body)
+    if _scheduler is not None and isinstance(_case_for_route, TokenGenerationCaseProtocol):
+        await asyncio.to_thread(_load_model)
+        try:
+            prepared = await asyncio.to_thread(_case_for_route.prepare, req)
+        except ValueError:
+            prepared = (
+                None  # Nothing to generate: the case's own predict builds the error response.
+            )
+        if prepared is not None:
+            return _json_response(await _predict_scheduled(_scheduler, _case_for_route, prepared))
+    return _json_response(await asyncio.wrap_future(_admit(lambda: _batcher.submit(req))))
+
+
+async def _threaded_chunks(
+    chunks: Iterator[str], cancel: threading.Event
+) -> AsyncGenerator[str, None]:
+    """Adapt a blocking predict_stream iterator without tying up the event loop.
+
+    Holds one of the `workers` stream slots until the stream ends (503 when none is free).
+    """
+    _admit(_acquire_stream_slot)
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            yield chunk
+    finally:
+        cancel.set()
+        _stream_slots.release()
+
+
+async def _scheduled_chunks(
+    scheduler: "ContinuousBatchScheduler", case: TokenGenerationCaseProtocol, req: BaseModel
+) -> AsyncGenerator[str, None]:
+    """Decode scheduler tokens incrementally, holding back partial multi-byte characters."""
+    prepared = await asyncio.to_thread(case.prepare, req)
+    handle = _submit_scheduled(scheduler, case, prepared)
+    tokens: list[int] = []
+    sent = ""
+    try:
+        while (token := await asyncio.to_thread(handle.tokens.get)) is not None:
+            tokens.append(token)
+            text = case.decode(tokens)
+            if text.endswith("\ufffd") or len(text) <= len(sent):
+                continue
+            chunk, sent = text[len(sent) :], text
+            yield chunk
+    finally:
+        handle.cancel()
+
+
+@app.post("/predict/stream", openapi_extra=_request_openapi(_case_for_route))
+async def predict_stream(http_request: Request) -> StreamingResponse:
+    """Stream generated text as server-sent events; a client disconnect stops generation."""
+    case = _case_for_route
+    req = _parse_request(await http_request.body())
+    model = await asyncio.to_thread(_load_model)
+    if _scheduler is not None and isinstance(case, TokenGenerationCaseProtocol):
+        chunks = _scheduled_chunks(_scheduler, case, req)
+    elif isinstance(case, StreamingCaseProtocol):
+        cancel = threading.Event()
+        chunks = _threaded_chunks(
+            case.predict_stream(model, req, cancel, _batching_config.torch_threads), cancel
+        )
+    else:
+        raise HTTPException(status_code=404, detail=f"Case {MODEL_CASE} does not stream")
+    try:
+        first = await anext(chunks, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    async def events() -> AsyncGenerator[str, None]:
+        chunk = first
+        try:
+            while chunk is not None:
+                yield f"data: {PredictStreamChunk(text=chunk).model_dump_json()}\n\n"
+                if await http_request.is_disconnected():
+                    return
+                chunk = await anext(chunks, None)
+            yield "event: done\ndata: {}\n\n"
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
 class HealthResponse(BaseModel):
     status: str
     case: str
+    error: str | None = None
 
 
 @app.get("/health", response_model=HealthResponse)  # type: ignore[reportUntypedFunctionDecorator]
-def health() -> HealthResponse:
-    return HealthResponse(status="ok", case=MODEL_CASE)
+def health(response: Response) -> HealthResponse:
+    """503 while SERVE_WARMUP is loading the model, so probes hold traffic back."""
+    if _ready.is_set():
+        return HealthResponse(status="ok", case=MODEL_CASE)
+    response.status_code = 503
+    if _warmup_error is not None:
+        return HealthResponse(status="error", case=MODEL_CASE, error=_warmup_error)
+    return HealthResponse(status="warming", case=MODEL_CASE)
+
+
+@app.get("/metrics", response_model=BatchingMetrics)  # type: ignore[reportUntypedFunctionDecorator]
+def metrics() -> BatchingMetrics:
+    """Queue depth and effective batch size of the /predict micro-batcher."""
+    return _batcher.metrics()
+
+
+if _scheduler is not None:
+    from serve.scheduler import SchedulerMetrics
+
+    @app.get("/metrics/scheduler", response_model=SchedulerMetrics)  # type: ignore[reportUntypedFunctionDecorator]
+    def scheduler_metrics() -> SchedulerMetrics:
+        """Running/waiting sequences and mean decode batch size of the scheduler."""
+        assert _scheduler is not None
+        return _scheduler.metrics()
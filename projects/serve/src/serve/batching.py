@@ -0,0 +1,216 @@
+"""Request-coalescing micro-batcher in front of CaseProtocol.predict_batch.
+
+Concurrent /predict calls are queued; `workers` inference threads drain the queue into
+batches of up to `max_batch_size` requests (waiting at most `max_wait_ms` after the
+first one arrives), run one batched forward each and fan the responses back out.
+
+The queue is bounded: once `max_queue` requests are waiting, `submit` raises
+`QueueFullError` so the route can shed load instead of letting latency grow without
+limit. Each worker pins its torch intra-op thread count so `workers` concurrent
+forwards share the cores instead of oversubscribing them.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import NamedTuple
+
+import torch
+from common.serve_base import CaseProtocol
+from pydantic import BaseModel
+
+
+class BatchingConfig(BaseModel):
+    max_batch_size: int = 16
+    max_wait_ms: float = 5.0
+    workers: int = 1
+    threads_per_worker: int = 0  # 0: split the cores evenly between workers
+    max_queue: int = 256
+    processes: int = 1  # Serve processes on the host (serve.workers); they share the cores too
+
+    @classmethod
+    def from_env(cls) -> "BatchingConfig":
+        return cls(
+            max_batch_size=int(os.environ.get("MAX_BATCH_SIZE", 16)),
+            max_wait_ms=float(os.environ.get("MAX_WAIT_MS", 5.0)),
+            workers=int(os.environ.get("INFERENCE_WORKERS", 1)),
+            threads_per_worker=int(os.environ.get("TORCH_THREADS_PER_WORKER", 0)),
+            max_queue=int(os.environ.get("MAX_QUEUE_DEPTH", 256)),
+            processes=int(os.environ.get("SERVE_PROCESSES", 1)),
+        )
+
+    @property
+    def torch_threads(self) -> int:
+        if self.threads_per_worker > 0:
+            return self.threads_per_worker
+        return max(1, (os.cpu_count() or 1) // (self.workers * self.processes))
+
+
+class BatchingMetrics(BaseModel):
+    """Snapshot of batcher state for the /metrics endpoint."""
+
+    queue_depth: int
+    requests: int
+    batches: int
+    rejected: int
+    workers: int
+    mean_batch_size: float
+    batch_size_counts: dict[int, int]
+
+
+class QueueFullError(RuntimeError):
+    """A bounded serve queue (batcher, scheduler, streams) is full; retry later."""
+
+
+class _Pending(NamedTuple):
+    request: BaseModel
+    future: Future[BaseModel]
+
+
+class _Job(NamedTuple):
+    """Unbatched work (e.g. an already-batched binary body) run on an inference worker."""
+
+    run: Callable[[], BaseModel]
+    future: Future[BaseModel]
+
+
+class MicroBatcher:
+    """Coalesces concurrent predict calls into batched `predict_batch` calls."""
+
+    def __init__(
+        self,
+        case: CaseProtocol[object],
+        load_model: Callable[[], object],
+        config: BatchingConfig,
+    ) -> None:
+        self._case = case
+        self._load_model = load_model
+        self._config = config
+        self._queue: queue.Queue[_Pending | _Job] = queue.Queue(maxsize=config.max_queue)
+        self._threads: list[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._rejected = 0
+        self._batch_size_counts: dict[int, int] = {}
+
+    def submit(self, request: BaseModel) -> Future[BaseModel]:
+        """Enqueue a validated request. The future resolves to the case response.
+
+        Raises QueueFullError when `max_queue` requests are already waiting.
+        """
+        future: Future[BaseModel] = Future()
+        self._enqueue(_Pending(request, future))
+        return future
+
+    def run(self, fn: Callable[[], BaseModel]) -> Future[BaseModel]:
+        """Run `fn` alone on an inference worker, under the same queue bound as submit."""
+        future: Future[BaseModel] = Future()
+        self._enqueue(_Job(fn, future))
+        return future
+
+    def metrics(self) -> BatchingMetrics:
+        batches = self._batches
+        return BatchingMetrics(
+            queue_depth=self._queue.qsize(),
+            requests=self._requests,
+            batches=batches,
+            rejected=self._rejected,
+            workers=self._config.workers,
+            mean_batch_size=self._requests / batches if batches else 0.0,
+            batch_size_counts=dict(sorted(self._batch_size_counts.items())),
+        )
+
+    def _enqueue(self, item: _Pending | _Job) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._stats_lock:
+                self._rejected += 1
+            raise QueueFullError(f"{self._config.max_queue} requests already queued") from None
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._start_lock:
+            if not self._threads:
+                for i in range(self._config.workers):
+                    thread = threading.Thread(
+                        target=self._run, name=f"micro-batcher-{i}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+
+    def _run(self) -> None:
+        torch.set_num_threads(self._config.torch_threads)
+        while True:
+            batch, jobs = self._collect()
+            if batch:
+                self._execute(batch)
+            for job in jobs:
+                self._execute_job(job)
+
+    def _collect(self) -> tuple[list[_Pending], list[_Job]]:
+        """Block for the first item, then gather more requests until size or deadline.
+
+        Jobs picked up along the way are returned separately and run after the batch.
+        """
+        batch: list[_Pending] = []
+        jobs: list[_Job] = []
+        first = self._queue.get()
+        if isinstance(first, _Job):
+            return batch, [first]
+        batch.append(first)
+        deadline = time.monotonic() + self._config.max_wait_ms / 1000.0
+        while len(batch) < self._config.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if isinstance(item, _Job):
+                jobs.append(item)
+            else:
+                batch.append(item)
+        return batch, jobs
+
+    def _execute(self, batch: list[_Pending]) -> None:
+        with self._stats_lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._batch_size_counts[len(batch)] = self._batch_size_counts.get(len(batch), 0) + 1
+        try:
+            model = self._load_model()
+            responses = self._case.predict_batch(model, [p.request for p in batch])
+            if len(responses) != len(batch):
+                raise RuntimeError(f"predict_batch returned {len(responses)} for {len(batch)}")
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            # One malformed request must not fail its neighbours: retry individually.
+            self._execute_each(batch)
+            return
+        for pending, response in zip(batch, responses, strict=True):
+            pending.future.set_result(response)
+
+    def _execute_each(self, batch: list[_Pending]) -> None:
+        for pending in batch:
+            try:
+                model = self._load_model()
+                pending.future.set_result(self._case.predict(model, pending.request))
+            except Exception as e:
+                pending.future.set_exception(e)
+
+    def _execute_job(self, job: _Job) -> None:
+        try:
+            job.future.set_result(job.run())
+        except Exception as e:
+            job.future.set_exception(e)
@@ -0,0 +1,148 @@
+"""Benchmark serve cold start: time from process start to the first successful prediction.
+
+Each run spawns a fresh `uvicorn serve.app:app` with MODEL_CASE/MODEL_PATH set, then polls
+/health and POSTs /predict until one answers 200, which is what a Cloud Run cold start
+costs the first request. Reported per model file (median over runs):
+
+- ready_ms: process start to /health answering (imports + app startup, port open);
+- first_ms: process start to the first 200 from /predict (includes the model load);
+- anon_mb / file_mb: the server's private and file-backed resident memory afterwards.
+  Memory-mapped weights show up as file_mb, which every worker mapping the same file
+  shares; weights copied into the process show up as anon_mb.
+
+With no paths, a freshly initialized MNIST model is written as both a legacy pickled .pt
+and a .safetensors file, so the two load paths can be compared.
+
+Usage: python -m serve.bench_cold_start [PATH ...] [--case mnist] [--runs 3] [--body JSON]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import torch
+from pydantic import BaseModel
+
+_BODIES = {
+    "mnist": json.dumps({"image": [0.0] * 28 * 28}),
+    "lora": json.dumps({"prompt": "Hello"}),
+}
+
+
+class ColdStart(BaseModel):
+    ready_ms: float
+    first_ms: float
+    anon_mb: float
+    file_mb: float
+
+
+class BenchResult(BaseModel):
+    path: str
+    runs: list[ColdStart]
+
+    def median(self, field: str) -> float:
+        return statistics.median(getattr(run, field) for run in self.runs)
+
+
+def _rss_mb(pid: int) -> tuple[float, float]:
+    """(RssAnon, RssFile) of `pid` in MB; zeros where /proc is unavailable."""
+    fields: dict[str, float] = {}
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return fields.get("RssAnon", 0.0), fields.get("RssFile", 0.0)
+
+
+def cold_start(case: str, path: str, body: bytes, port: int, timeout: float) -> ColdStart:
+    env = {**os.environ, "MODEL_CASE": case, "MODEL_PATH": path, "SERVE_WARMUP": "0"}
+    command = [sys.executable, "-m", "uvicorn", "serve.app:app", "--port", str(port)]
+    command += ["--log-level", "warning"]
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env)
+    ready_ms: float | None = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with {server.returncode}")
+            try:
+                if ready_ms is None:
+                    urllib.request.urlopen(f"{url}/health", timeout=timeout).close()
+                    ready_ms = (time.perf_counter() - start) * 1000
+                request = urllib.request.Request(
+                    f"{url}/predict", data=body, headers={"content-type": "application/json"}
+                )
+                urllib.request.urlopen(request, timeout=timeout).close()
+            except urllib.error.HTTPError as e:
+                if e.code != 503:  # 503: still warming up or shedding load
+                    raise
+                time.sleep(0.01)
+                continue
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)  # Not listening yet
+                continue
+            anon, file = _rss_mb(server.pid)
+            first_ms = (time.perf_counter() - start) * 1000
+            return ColdStart(ready_ms=ready_ms, first_ms=first_ms, anon_mb=anon, file_mb=file)
+        raise TimeoutError(f"No prediction from {path} within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _default_models(directory: Path) -> list[str]:
+    from common.weights import save_weights
+    from mnist.model import MnistCNN
+
+    state = MnistCNN().state_dict()
+    legacy = directory / "model.pt"
+    torch.save(state, legacy)
+    return [str(legacy), str(save_weights(state, directory / "model.safetensors"))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark serve time-to-first-prediction")
+    parser.add_argument("paths", nargs="*", help="MODEL_PATH values to compare")
+    parser.add_argument("--case", default="mnist", choices=sorted(_BODIES))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--body", help="JSON /predict body (default: a minimal one per case)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+    body = (args.body or _BODIES[args.case]).encode()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args.paths or (_default_models(Path(tmp)) if args.case == "mnist" else [])
+        if not paths:
+            parser.error(f"Give MODEL_PATH values to compare for case {args.case}")
+        results = [
+            BenchResult(
+                path=path,
+                runs=[
+                    cold_start(args.case, path, body, args.port, args.timeout)
+                    for _ in range(args.runs)
+                ],
+            )
+            for path in paths
+        ]
+    print(f"{'model':<40} {'ready ms':>9} {'first ms':>9} {'anon MB':>8} {'file MB':>8}")
+    for r in results:
+        print(
+            f"{Path(r.path).name:<40} {r.median('ready_ms'):>9.0f} {r.median('first_ms'):>9.0f}"
+            f" {r.median('anon_mb'):>8.0f} {r.median('file_mb'):>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark /predict end to end through the app, the old route vs the current one.
+
+before: the route as it was. The body is parsed into PredictRequestBody, dumped to a dict
+and validated again into RequestModel; FastAPI encodes the returned model with
+jsonable_encoder. It is rebuilt here on its own FastAPI app that shares serve.app's batcher.
+after: serve.app's /predict. The body is validated once into RequestModel and the response
+is written with model_dump_json.
+batched: one application/octet-stream body carrying all N images, decoded by the case in
+one call (serve.app's /predict as well).
+
+Each size is N single-image MNIST requests sent one after another through a TestClient
+(in-process ASGI, no sockets), so the times include routing, the micro-batcher and the
+forward of a freshly initialized model. MAX_WAIT_MS defaults to 0 here: sequential requests
+would otherwise each wait for company that never comes.
+
+Usage: python -m serve.bench_validation [--sizes 1 16 256] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from common.serve_models import PredictRequestBody
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ValidationError
+
+
+class BenchResult(BaseModel):
+    requests: int
+    before_ms: float
+    after_ms: float
+    batched_ms: float
+    speedup: float  # before / after
+
+
+def _before_app() -> FastAPI:
+    """/predict for JSON bodies as it was before they were validated once."""
+    from serve import app as serve_app
+
+    case = serve_app._case_for_route  # pyright: ignore[reportPrivateUsage]
+    batcher = serve_app._batcher  # pyright: ignore[reportPrivateUsage]
+    before = FastAPI()
+
+    @before.post("/predict", response_model=None)  # type: ignore[reportUntypedFunctionDecorator]
+    async def predict(http_request: Request) -> BaseModel:
+        body = await http_request.body()
+        try:
+            request = PredictRequestBody.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors()) from e
+        req = case.RequestModel.model_validate(request.model_dump())
+        return await asyncio.wrap_future(batcher.submit(req))
+
+    return before
+
+
+def _post_each(client: TestClient, bodies: list[bytes], content_type: str) -> None:
+    for body in bodies:
+        response = client.post("/predict", content=body, headers={"content-type": content_type})
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict answered {response.status_code}: {response.text}")
+
+
+def _best_ms(fn: Callable[[], None], repeat: int) -> float:
+    fn()  # Warm up: model load, first forward at this batch shape
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench(before: TestClient, after: TestClient, n: int, repeat: int) -> BenchResult:
+    from mnist.serve import PIXELS, RAW_CONTENT_TYPE
+
+    rng = random.Random(0)
+    images = [[rng.random() for _ in range(PIXELS)] for _ in range(n)]
+    bodies = [json.dumps({"image": image}).encode() for image in images]
+    batched = [struct.pack(f"<{n * PIXELS}f", *(x for image in images for x in image))]
+    before_ms = _best_ms(lambda: _post_each(before, bodies, "application/json"), repeat)
+    after_ms = _best_ms(lambda: _post_each(after, bodies, "application/json"), repeat)
+    batched_ms = _best_ms(lambda: _post_each(after, batched, RAW_CONTENT_TYPE), repeat)
+    return BenchResult(
+        requests=n,
+        before_ms=before_ms,
+        after_ms=after_ms,
+        batched_ms=batched_ms,
+        speedup=before_ms / after_ms,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark /predict, old route vs current")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 256])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        from common.weights import save_weights
+        from mnist.model import MnistCNN
+
+        path = save_weights(MnistCNN().state_dict(), Path(tmp) / "model.safetensors")
+        # serve.app reads its configuration when imported.
+        os.environ.update(MODEL_CASE="mnist", MODEL_PATH=str(path), SERVE_WARMUP="0")
+        os.environ.setdefault("MAX_WAIT_MS", "0")
+        from serve import app as serve_app
+
+        with TestClient(_before_app()) as before, TestClient(serve_app.app) as after:
+            results = [bench(before, after, n, args.repeat) for n in args.sizes]
+    print(f"{'requests':>8} {'before ms':>10} {'after ms':>10} {'batched ms':>11} {'speedup':>8}")
+    for r in results:
+        print(
+            f"{r.requests:>8} {r.before_ms:>10.2f} {r.after_ms:>10.2f} {r.batched_ms:>11.2f}"
+            f" {r.speedup:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""Iteration-level (continuous) batching for causal-LM generation.
+
+Unlike `MicroBatcher`, which runs each batch to completion, the scheduler works one
+decode step at a time: every step it admits waiting sequences into free slots (one
+prefill each), runs a single batched decode over all running sequences, and evicts
+the ones that finished. Short prompts therefore never wait on long generations.
+
+Per-sequence KV caches live in a pool preallocated at startup:
+`[layers] x (slots, kv_heads, max_seq_len, head_dim)` for keys and values. A decode
+step gathers the running slots into a left-padded batch cache, and the key/value each
+layer appends is written back into the owning slot, so prompts are never recomputed.
+
+Like the micro-batcher's, the waiting queue is bounded: `submit` raises `QueueFullError`
+once `max_queue` sequences are waiting for a slot.
+"""
+
+import os
+import queue
+import threading
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import Any, cast
+
+import torch
+from common.serve_models import PreparedGeneration
+from pydantic import BaseModel
+from transformers import DynamicCache, PretrainedConfig
+
+from serve.batching import QueueFullError
+
+
+class SchedulerConfig(BaseModel):
+    max_slots: int = 16
+    max_seq_len: int = 512
+    max_queue: int = 256  # Sequences waiting for a slot before submit raises QueueFullError
+
+    @classmethod
+    def from_env(cls) -> "SchedulerConfig":
+        return cls(
+            max_slots=int(os.environ.get("SCHEDULER_MAX_SLOTS", 16)),
+            max_seq_len=int(os.environ.get("SCHEDULER_MAX_SEQ_LEN", 512)),
+            max_queue=int(os.environ.get("SCHEDULER_MAX_QUEUE", 256)),
+        )
+
+
+class SchedulerMetrics(BaseModel):
+    running: int
+    waiting: int
+    free_slots: int
+    rejected: int
+    steps: int
+    mean_batch_size: float
+
+
+class GenerationHandle:
+    """Caller side of one sequence: streamed token ids, final result, cancellation."""
+
+    def __init__(
+        self,
+        prompt_ids: list[int],
+        max_new_tokens: int,
+        temperature: float,
+        adapter_name: str | None = None,
+    ) -> None:
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.adapter_name = adapter_name
+        self.tokens: queue.Queue[int | None] = queue.Queue()  # None marks the end
+        self.result: Future[list[int]] = Future()
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """Ask the scheduler to evict this sequence at the next step."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+
+class _Sequence:
+    """Scheduler-side state of one running sequence."""
+
+    def __init__(self, handle: GenerationHandle, slot: int, length: int) -> None:
+        self.handle = handle
+        self.slot = slot
+        self.length = length  # tokens currently held in this slot's KV cache
+        self.generated: list[int] = []
+        self.next_token = 0  # sampled but not yet fed through the model
+
+
+class _RecordingCache(DynamicCache):
+    """DynamicCache that remembers the key/value each layer appends during a forward."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.appended: dict[int, tuple[torch.Tensor, torch.Tensor]] = {}
+
+    def update(
+        self,
+        key_states: torch.Tensor,
+        value_states: torch.Tensor,
+        layer_idx: int,
+        cache_kwargs: dict[str, Any] | None = None,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        self.appended[layer_idx] = (key_states, value_states)
+        return super().update(key_states, value_states, layer_idx, cache_kwargs)
+
+
+class KVCachePool:
+    """Preallocated per-slot key/value storage for every decoder layer."""
+
+    def __init__(
+        self,
+        num_layers: int,
+        num_kv_heads: int,
+        head_dim: int,
+        config: SchedulerConfig,
+        dtype: torch.dtype,
+        device: torch.device,
+    ) -> None:
+        shape = (config.max_slots, num_kv_heads, config.max_seq_len, head_dim)
+        self.keys = [torch.zeros(shape, dtype=dtype, device=device) for _ in range(num_layers)]
+        self.values = [torch.zeros(shape, dtype=dtype, device=device) for _ in range(num_layers)]
+        self.free: deque[int] = deque(range(config.max_slots))
+
+    def write(self, slot: int, start: int, cache: _RecordingCache, row: int) -> None:
+        """Copy the K/V appended for batch `row` into `slot` at positions [start, ...)."""
+        for layer, (k, v) in cache.appended.items():
+            end = start + k.shape[2]
+            self.keys[layer][slot, :, start:end] = k[row]
+            self.values[layer][slot, :, start:end] = v[row]
+
+    def gather(self, sequences: list[_Sequence]) -> _RecordingCache:
+        """Build a left-padded batch cache holding each sequence's cached prefix."""
+        width = max(s.length for s in sequences)
+        cache = _RecordingCache()
+        for layer, (pool_k, pool_v) in enumerate(zip(self.keys, self.values, strict=True)):
+            k = pool_k.new_zeros((len(sequences), pool_k.shape[1], width, pool_k.shape[3]))
+            v = torch.zeros_like(k)
+            for row, seq in enumerate(sequences):
+                k[row, :, width - seq.length :] = pool_k[seq.slot, :, : seq.length]
+                v[row, :, width - seq.length :] = pool_v[seq.slot, :, : seq.length]
+            cache.update(k, v, layer)
+        cache.appended.clear()
+        return cache
+
+
+class ContinuousBatchScheduler:
+    """Runs decode steps over a changing set of sequences on one background thread."""
+
+    def __init__(
+        self,
+        load_model: Callable[[], object],
+        eos_token_id: Callable[[], int],
+        config: SchedulerConfig,
+    ) -> None:
+        self._load_model = load_model
+        self._eos_token_id = eos_token_id
+        self._config = config
+        self._waiting: queue.Queue[GenerationHandle] = queue.Queue(maxsize=config.max_queue)
+        self._running: list[_Sequence] = []
+        self._pool: KVCachePool | None = None
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._steps = 0
+        self._decoded = 0
+        self._rejected = 0
+
+    def submit(self, prepared: PreparedGeneration) -> GenerationHandle:
+        """Queue a prompt. Over-long prompts keep their last tokens so generation fits.
+
+        Raises QueueFullError when `max_queue` prompts are already waiting for a slot.
+        """
+        keep = max(1, self._config.max_seq_len - prepared.max_new_tokens)
+        handle = GenerationHandle(
+            prepared.prompt_ids[-keep:],
+            prepared.max_new_tokens,
+            prepared.temperature,
+            prepared.adapter_name,
+        )
+        self._ensure_started()
+        try:
+            self._waiting.put_nowait(handle)
+        except queue.Full:
+            self._rejected += 1
+            raise QueueFullError(f"{self._config.max_queue} sequences already waiting") from None
+        return handle
+
+    def metrics(self) -> SchedulerMetrics:
+        free = len(self._pool.free) if self._pool is not None else self._config.max_slots
+        return SchedulerMetrics(
+            running=len(self._running),
+            waiting=self._waiting.qsize(),
+            free_slots=free,
+            rejected=self._rejected,
+            steps=self._steps,
+            mean_batch_size=self._decoded / self._steps if self._steps else 0.0,
+        )
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            model = cast(torch.nn.Module, self._load_model())
+            self._pool = self._build_pool(model)
+            eos = self._eos_token_id()
+        except Exception as e:
+            while True:  # Nothing can run: fail every request instead of hanging it.
+                self._fail(self._waiting.get(), e)
+        while True:
+            self._admit(model, block=not self._running)
+            if self._running:
+                try:
+                    with torch.no_grad():
+                        self._step(model)
+                except Exception as e:
+                    for seq in self._running:
+                        self._pool.free.append(seq.slot)
+                        self._fail(seq.handle, e)
+                    self._running = []
+            self._evict(eos)
+
+    def _build_pool(self, model: torch.nn.Module) -> KVCachePool:
+        cfg = cast(PretrainedConfig, model.config)
+        heads = cfg.num_attention_heads
+        param = next(model.parameters())
+        return KVCachePool(
+            num_layers=cfg.num_hidden_layers,
+            num_kv_heads=getattr(cfg, "num_key_value_heads", None) or heads,
+            head_dim=getattr(cfg, "head_dim", None) or cfg.hidden_size // heads,
+            config=self._config,
+            dtype=param.dtype,
+            device=param.device,
+        )
+
+    def _admit(self, model: torch.nn.Module, block: bool) -> None:
+        """Move waiting sequences into free slots, prefilling each prompt."""
+        assert self._pool is not None
+        while self._pool.free:
+            try:
+                handle = self._waiting.get(block=block)
+            except queue.Empty:
+                return
+            block = False
+            if handle.cancelled:
+                self._finish(handle, [])
+                continue
+            seq = _Sequence(handle, self._pool.free.popleft(), 0)
+            try:
+                with torch.no_grad():
+                    self._prefill(model, seq)
+            except Exception as e:
+                self._pool.free.append(seq.slot)
+                self._fail(handle, e)
+                continue
+            self._running.append(seq)
+
+    def _prefill(self, model: torch.nn.Module, seq: _Sequence) -> None:
+        assert self._pool is not None
+        device = self._pool.keys[0].device
+        input_ids = torch.tensor([seq.handle.prompt_ids], dtype=torch.long, device=device)
+        cache = _RecordingCache()
+        logits = model(
+            input_ids=input_ids,
+            past_key_values=cache,
+            use_cache=True,
+            **self._adapter_kwargs(model, [seq]),
+        ).logits
+        self._pool.write(seq.slot, 0, cache, 0)
+        seq.length = input_ids.shape[1]
+        self._emit(seq, int(self._sample(logits[:, -1], [seq])[0]))
+
+    def _step(self, model: torch.nn.Module) -> None:
+        """One decode step: feed every running sequence its last sampled token."""
+        assert self._pool is not None
+        running = self._running
+        device = self._pool.keys[0].device
+        width = max(s.length for s in running)
+        cache = self._pool.gather(running)
+        attention_mask = torch.zeros((len(running), width + 1), dtype=torch.long, device=device)
+        for row, seq in enumerate(running):
+            attention_mask[row, width - seq.length :] = 1
+        input_ids = torch.tensor([[s.next_token] for s in running], device=device)
+        position_ids = torch.tensor([[s.length] for s in running], device=device)
+        logits = model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=cache,
+            use_cache=True,
+            **self._adapter_kwargs(model, running),
+        ).logits
+        for row, seq in enumerate(running):
+            self._pool.write(seq.slot, seq.length, cache, row)
+            seq.length += 1
+        for seq, token in zip(running, self._sample(logits[:, -1], running).tolist(), strict=True):
+            self._emit(seq, int(token))
+        self._steps += 1
+        self._decoded += len(running)
+
+    def _adapter_kwargs(
+        self, model: torch.nn.Module, sequences: list[_Sequence]
+    ) -> dict[str, list[str]]:
+        """peft `adapter_names` when any sequence asked for a non-default LoRA adapter."""
+        names = [s.handle.adapter_name for s in sequences]
+        if all(name is None for name in names):
+            return {}
+        active = str(getattr(model, "active_adapter", "__base__"))
+        return {"adapter_names": [name or active for name in names]}
+
+    def _sample(self, logits: torch.Tensor, sequences: list[_Sequence]) -> torch.Tensor:
+        temps = torch.tensor(
+            [s.handle.temperature for s in sequences], dtype=logits.dtype, device=logits.device
+        )
+        greedy = logits.argmax(dim=-1)
+        if bool((temps <= 0).all()):
+            return greedy
+        probs = torch.softmax(logits / temps.clamp(min=1e-5).unsqueeze(1), dim=-1)
+        sampled = torch.multinomial(probs, num_samples=1).squeeze(1)
+        return torch.where(temps <= 0, greedy, sampled)
+
+    def _emit(self, seq: _Sequence, token: int) -> None:
+        seq.generated.append(token)
+        seq.next_token = token
+        seq.handle.tokens.put(token)
+
+    def _evict(self, eos: int) -> None:
+        """Free the slots of sequences that hit EOS, their budget, the pool or a cancel."""
+        assert self._pool is not None
+        still_running: list[_Sequence] = []
+        for seq in self._running:
+            done = (
+                seq.next_token == eos
+                or len(seq.generated) >= seq.handle.max_new_tokens
+                or seq.length >= self._config.max_seq_len
+                or seq.handle.cancelled
+            )
+            if done:
+                self._pool.free.append(seq.slot)
+                self._finish(seq.handle, seq.generated)
+            else:
+                still_running.append(seq)
+        self._running = still_running
+
+    def _finish(self, handle: GenerationHandle, generated: list[int]) -> None:
+        handle.tokens.put(None)
+        handle.result.set_result(generated)
+
+    def _fail(self, handle: GenerationHandle, error: Exception) -> None:
+        handle.tokens.put(None)
+        handle.result.set_exception(error)
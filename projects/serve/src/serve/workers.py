@@ -0,0 +1,185 @@
+"""Pre-forking serve supervisor: load the model once, then fork the uvicorn workers.
+
+`uvicorn --workers N` starts N fresh interpreters, and each one imports serve.app and
+loads its own copy of the weights, so memory grows with N. Here the parent imports the
+app, runs `case.load` and binds the port. It then forks N workers that serve the same
+socket. Workers inherit the loaded model (and the case state built with it) and never
+call `case.load`:
+
+- Weights memory-mapped from safetensors (common.weights) stay shared through the page
+  cache.
+- Whatever else the load allocated (converted weights, tokenizer, buffers) is shared
+  copy-on-write. Inference only reads weights, so those pages are never copied.
+  `gc.freeze()` keeps the workers' garbage collector from writing to, and so copying,
+  the pages of objects inherited from the parent.
+- The parent loads with one torch thread. The OpenMP thread pool does not survive
+  fork, and a worker hangs in its first parallel region if the parent started one. For
+  the same reason the parent never runs a forward; SERVE_WARMUP warms up each worker.
+
+CUDA cannot be used across fork, so this mode is CPU-only. A worker that exits is
+re-forked from the parent, again without loading. SIGTERM/SIGINT stop the workers
+gracefully; workers still running `graceful_timeout` seconds later (or at a second
+signal) are killed, and the parent exits once they are gone. The GCS client is
+recreated in each worker (common.transfer), so no connection is shared across processes.
+
+Usage: python -m serve.workers [--host 0.0.0.0] [--port 8080] [--processes N]
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from types import FrameType
+
+import torch
+import uvicorn
+from pydantic import BaseModel
+
+# A worker that dies sooner than this after starting is re-forked only after a pause.
+_MIN_UPTIME_S = 1.0
+# Extra time past uvicorn's own graceful shutdown timeout before workers are killed.
+_KILL_MARGIN_S = 5.0
+
+
+class WorkerConfig(BaseModel):
+    host: str = "0.0.0.0"
+    port: int = 8080
+    processes: int = 1
+    log_level: str = "info"
+    graceful_timeout: float = 30.0  # Seconds for workers to drain before SIGKILL
+
+    @classmethod
+    def from_env(cls) -> "WorkerConfig":
+        return cls(
+            host=os.environ.get("HOST", "0.0.0.0"),
+            port=int(os.environ.get("PORT", 8080)),
+            processes=int(os.environ.get("SERVE_PROCESSES", os.cpu_count() or 1)),
+            log_level=os.environ.get("LOG_LEVEL", "info"),
+            graceful_timeout=float(os.environ.get("SERVE_GRACEFUL_TIMEOUT", 30.0)),
+        )
+
+
+def _serve(config: uvicorn.Config, sock: socket.socket) -> None:
+    """Worker body: run uvicorn on the inherited socket, then exit without cleanup."""
+    code = 0
+    try:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGALRM):
+            signal.signal(sig, signal.SIG_DFL)  # uvicorn installs its own handlers
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)  # Never return into the parent's supervisor loop
+
+
+def run(config: WorkerConfig) -> None:
+    # serve.app reads SERVE_PROCESSES when imported, to split the cores between processes.
+    os.environ["SERVE_PROCESSES"] = str(config.processes)
+    threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+
+    from serve import app as serve_app
+
+    start = time.perf_counter()
+    serve_app.preload()
+    if torch.cuda.is_initialized():
+        raise RuntimeError("serve.workers forks after loading, which CUDA does not support")
+    print(f"Loaded {serve_app.MODEL_CASE} in {time.perf_counter() - start:.1f}s", flush=True)
+    torch.set_num_threads(threads)
+
+    uvicorn_config = uvicorn.Config(
+        serve_app.app,
+        host=config.host,
+        port=config.port,
+        log_level=config.log_level,
+        timeout_graceful_shutdown=max(1, int(config.graceful_timeout)),
+    )
+    sock = uvicorn_config.bind_socket()
+    gc.collect()
+    gc.freeze()
+
+    workers: dict[int, float] = {}  # pid -> start time
+    stopping = False
+
+    def fork_worker() -> None:
+        pid = os.fork()
+        if pid == 0:
+            _serve(uvicorn_config, sock)
+        workers[pid] = time.monotonic()
+        if stopping:  # Signalled between fork and the line above
+            os.kill(pid, signal.SIGTERM)
+
+    def signal_workers(sig: signal.Signals) -> None:
+        for pid in workers:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def stop(signum: int, _frame: FrameType | None) -> None:
+        nonlocal stopping
+        if stopping:  # Second signal: don't wait for the drain
+            signal_workers(signal.SIGKILL)
+            return
+        stopping = True
+        signal_workers(signal.SIGTERM)
+        # Past the graceful timeout, SIGALRM kills what is left; os.wait() below returns
+        # as each worker goes.
+        signal.setitimer(signal.ITIMER_REAL, config.graceful_timeout + _KILL_MARGIN_S)
+
+    def kill(signum: int, _frame: FrameType | None) -> None:
+        print(f"Workers still running after {config.graceful_timeout}s; killing", flush=True)
+        signal_workers(signal.SIGKILL)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGALRM, kill)
+    for _ in range(config.processes):
+        fork_worker()
+    print(f"Serving on {config.host}:{config.port} with {config.processes} workers", flush=True)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"Worker {pid} exited ({os.waitstatus_to_exitcode(status)}); restarting", flush=True)
+        if time.monotonic() - started < _MIN_UPTIME_S:
+            time.sleep(_MIN_UPTIME_S)
+        if not stopping:
+            fork_worker()
+    sock.close()
+
+
+def main() -> None:
+    defaults = WorkerConfig.from_env()
+    parser = argparse.ArgumentParser(description="Serve with worker processes sharing one model")
+    parser.add_argument("--host", default=defaults.host)
+    parser.add_argument("--port", type=int, default=defaults.port)
+    parser.add_argument("--processes", type=int, default=defaults.processes)
+    parser.add_argument("--log-level", default=defaults.log_level)
+    parser.add_argument("--graceful-timeout", type=float, default=defaults.graceful_timeout)
+    args = parser.parse_args()
+    run(
+        WorkerConfig(
+            host=args.host,
+            port=args.port,
+            processes=args.processes,
+            log_level=args.log_level,
+            graceful_timeout=args.graceful_timeout,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Malformed .npy bodies on /predict are client errors (400), never server errors.
+
+Run: python -m unittest discover projects/serve/tests (or pytest)
+"""
+
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+from common.weights import save_weights
+from fastapi.testclient import TestClient
+from mnist.model import MnistCNN
+from serve import app as serve_app
+
+NPY = "application/x-npy"
+
+
+def _npy(header: bytes, version: int = 1) -> bytes:
+    """An .npy preamble with `header` and its length field, no array data."""
+    length = struct.pack("<H" if version == 1 else "<I", len(header))
+    return b"\x93NUMPY" + bytes([version, 0]) + length + header
+
+
+class MalformedNpyTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        path = save_weights(MnistCNN().state_dict(), Path(self.tmp.name) / "model.safetensors")
+        self.saved = (serve_app.MODEL_PATH, serve_app._model)  # pyright: ignore[reportPrivateUsage]
+        serve_app.MODEL_PATH = str(path)
+        serve_app._model = None  # pyright: ignore[reportPrivateUsage]
+        self.client = TestClient(serve_app.app)
+
+    def tearDown(self) -> None:
+        serve_app.MODEL_PATH, serve_app._model = self.saved  # pyright: ignore[reportPrivateUsage]
+        self.tmp.cleanup()
+
+    def post(self, body: bytes) -> int:
+        return self.client.post("/predict", content=body, headers={"content-type": NPY}).status_code
+
+    def test_truncated_preamble(self) -> None:
+        for body in (
+            b"\x93NUMPY",
+            b"\x93NUMPY\x01\x00",
+            b"\x93NUMPY\x01\x00\x10",
+            b"\x93NUMPY\x02\x00\x10\x00",
+        ):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body), 400)
+
+    def test_header_past_end_of_body(self) -> None:
+        body = b"\x93NUMPY\x01\x00" + struct.pack("<H", 1000) + b"{'descr': '|u1'"
+        self.assertEqual(self.post(body), 400)
+
+    def test_garbage_header(self) -> None:
+        for header in (b"{'descr': ", b"not python", b"\xff\xfe{{{", b"[" * 10000):
+            with self.subTest(header=header[:16]):
+                self.assertEqual(self.post(_npy(header)), 400)
+                self.assertEqual(self.post(_npy(header, version=2)), 400)
+
+    def test_garbage_body(self) -> None:
+        self.assertEqual(self.post(b"definitely not numpy"), 400)
+
+    def test_valid_body(self) -> None:
+        header = b"{'descr': '|u1', 'fortran_order': False, 'shape': (1, 28, 28), }"
+        self.assertEqual(self.post(_npy(header) + bytes(28 * 28)), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()